@@ -0,0 +1,52 @@
+"""百万文件扫描结果的内存对比：Path列表 vs JobTable
+
+用法: python benchmarks/job_table_memory.py [文件数] [每个目录的文件数]
+用tracemalloc统计构建结果（含按目录建临时目录映射所需的目录集合）的峰值内存。
+"""
+from pathlib import Path
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core.job_queue import JobTable
+
+TARGET_MB = 250  # 100万文件时JobTable的峰值内存目标
+
+def synthetic_paths(count, per_dir):
+    root = os.path.join(os.sep, 'mnt', 'recordings')
+    for i in range(count):
+        yield os.path.join(root, f"room{i // per_dir:06d}", f"2024-01-01_{i:08d}_录像.mp4")
+
+def measure(label, build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} 常驻 {current / 2**20:8.1f} MB  峰值 {peak / 2**20:8.1f} MB  耗时 {elapsed:6.2f} 秒")
+    del result
+    return peak
+
+def build_paths(count, per_dir):
+    files = sorted(Path(p) for p in synthetic_paths(count, per_dir))
+    return files, set(f.parent for f in files)
+
+def build_table(count, per_dir):
+    table = JobTable.from_paths(synthetic_paths(count, per_dir))
+    table.sort()
+    return table, table.dir_paths()
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    per_dir = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    print(f"{count} 个文件，每个目录 {per_dir} 个")
+    measure('Path列表', lambda: build_paths(count, per_dir))
+    peak = measure('JobTable', lambda: build_table(count, per_dir))
+    target = TARGET_MB * count / 1_000_000
+    print(f"JobTable峰值 {'达到' if peak / 2**20 <= target else '未达到'}目标（{target:.0f} MB）")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+from pathlib import Path
+import errno
+import logging
+import os
+import shutil
+import threading
+from core import io_hints
+
+logger = logging.getLogger('mp4recovery')
+file_logger = logging.getLogger('mp4recovery.fileonly')
+
+def _rename(src, dst):
+    """同一文件系统内原子重命名，跨设备时退回到复制+删除（复制时不占用页缓存）"""
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        if not os.path.isfile(src):
+            shutil.move(str(src), str(dst))
+            return
+        io_hints.copy_file(src, dst)
+        shutil.copystat(src, dst)
+        os.unlink(src)
+
+def fsync_file(path):
+    """把文件数据刷到磁盘"""
+    # Windows下FlushFileBuffers需要写权限
+    flags = os.O_RDWR if os.name == 'nt' else os.O_RDONLY
+    fd = os.open(path, flags | getattr(os, 'O_BINARY', 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def fsync_dir(path):
+    """把目录项（重命名/删除）刷到磁盘，Windows不支持对目录fsync，直接跳过"""
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class CommitUnit:
+    """单个视频的提交单元：输出移动、关联文件重命名、原视频删除作为一个整体
+
+    每一步都是可逆的重命名，原视频和被覆盖的文件先暂存到临时目录，
+    任何一步失败时调用rollback()按相反顺序撤销；真正的删除在批量落盘后进行。
+    """
+    def __init__(self, staging_dir: Path):
+        self.staging_dir = Path(staging_dir)
+        self.renames = []    # 已完成的 (src, dst)，用于回滚
+        self.outputs = []    # 新生成/移入的文件，落盘时fsync
+        self.staged = []     # 暂存待删除的 (暂存路径, 原路径)
+        self.dirs = set()    # 涉及的目录，落盘时fsync
+
+    def move(self, src: Path, dst: Path):
+        """把新文件移动到目标位置，目标已存在时先暂存旧文件"""
+        if dst.exists():
+            self.stage_delete(dst, log=False)
+        self._do_rename(src, dst)
+        self.outputs.append(dst)
+
+    def rename(self, src: Path, dst: Path):
+        """重命名已有文件（如字幕、配置文件）"""
+        if dst.exists():
+            raise FileExistsError(f"目标文件已存在: {dst}")
+        self._do_rename(src, dst)
+
+    def stage_delete(self, path: Path, log=True):
+        """把要删除的文件移到临时目录，落盘后才真正删除"""
+        staged = self.staging_dir / (path.name + '.orig')
+        n = 1
+        while staged.exists():
+            staged = self.staging_dir / f"{path.name}.orig{n}"
+            n += 1
+        self._do_rename(path, staged)
+        self.staged.append((staged, path, log))
+
+    def _do_rename(self, src, dst):
+        _rename(src, dst)
+        self.renames.append((src, dst))
+        self.dirs.add(Path(src).parent)
+        self.dirs.add(Path(dst).parent)
+
+    def rollback(self):
+        """按相反顺序撤销所有已完成的重命名"""
+        for src, dst in reversed(self.renames):
+            try:
+                _rename(dst, src)
+            except Exception as e:
+                logger.error(f"回滚失败，请手动恢复: {dst} -> {src}，错误: {str(e)}")
+        self.renames.clear()
+        self.outputs.clear()
+        self.staged.clear()
+
+class CommitBatcher:
+    """批量落盘：每积累batch_size个提交单元，统一fsync一次文件和目录，再删除暂存的原文件
+
+    fsync失败的提交单元整体回滚（输出移回临时目录，原文件放回原位），不删除原文件。
+    """
+    def __init__(self, batch_size=16, durable=True):
+        self.batch_size = max(1, batch_size)
+        self.durable = durable
+        self.pending = []
+        self._lock = threading.Lock()
+
+    def add(self, unit: CommitUnit):
+        with self._lock:
+            self.pending.append(unit)
+            if len(self.pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        units, self.pending = self.pending, []
+        if not units:
+            return
+        failed = set()  # 输出未能落盘的提交单元，不删除其原文件
+        if self.durable:
+            dirs = {}
+            for k, unit in enumerate(units):
+                for output in unit.outputs:
+                    try:
+                        fsync_file(output)
+                    except OSError as e:
+                        logger.error(f"同步文件到磁盘失败: {output}，错误: {str(e)}")
+                        failed.add(k)
+                    else:
+                        # 已落盘的输出不再需要留在页缓存中
+                        io_hints.drop_file(output)
+                for d in unit.dirs:
+                    dirs.setdefault(d, []).append(k)
+            for d, owners in dirs.items():
+                try:
+                    fsync_dir(d)
+                except OSError as e:
+                    logger.error(f"同步目录到磁盘失败: {d}，错误: {str(e)}")
+                    failed.update(owners)
+        for k, unit in enumerate(units):
+            if k in failed:
+                # 新文件可能没有落盘：撤销该单元，原文件放回原位
+                originals = [str(original) for _, original, _ in unit.staged]
+                unit.rollback()
+                logger.error(f"处理结果未能落盘，已回滚并保留原文件: {'、'.join(originals) or unit.staging_dir}")
+                continue
+            # 新文件已落盘，此时删除原文件是安全的
+            for staged, original, log in unit.staged:
+                try:
+                    staged.unlink()
+                    if log:
+                        file_logger.info(f"删除原视频: {original}")
+                except OSError as e:
+                    logger.error(f"删除原视频失败: {original}（暂存于 {staged}），错误: {str(e)}")
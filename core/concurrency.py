@@ -0,0 +1,154 @@
+from pathlib import Path
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('mp4recovery')
+file_logger = logging.getLogger('mp4recovery.fileonly')
+
+MB = 1024 * 1024
+
+def volume_of(path):
+    """返回 (设备号, 挂载点)，同一设备上的任务共用一个并发限制"""
+    path = os.path.abspath(str(path))
+    dev = os.stat(path).st_dev
+    mount = path
+    while not os.path.ismount(mount):
+        parent = os.path.dirname(mount)
+        if parent == mount:
+            break
+        mount = parent
+    return dev, mount
+
+class AdaptiveLimiter:
+    """单个卷的并发限制，按实测聚合吞吐量爬山调整
+
+    每个窗口（至少window_jobs个且不少于当前并发数的任务，只统计在本窗口内开始的任务）
+    以完成的字节数除以窗口的实际经过时间（从第一个任务开始到最后一个任务结束）得到聚合吞吐量，
+    记在该并发数下（任务不够、实际并行数达不到并发数时测得的吞吐量也相应较低）。
+    吞吐量仍在上升时试探尚未测过的更高并发数（加性增加）；之后移向吞吐量最好的并发数，差距在tolerance以内时取较小的（单任务耗时更短、
+    机械硬盘/NAS上寻道更少），当前即为最好时保持不变。吞吐量相对该并发数的记录
+    跌到一半以下时视为负载变化：并发数减半（乘性减小）并清空记录重新试探。
+    """
+    def __init__(self, volume, min_limit=1, max_limit=1, window_jobs=2, tolerance=0.05):
+        self.volume = volume
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = self.min_limit
+        self.window_jobs = window_jobs
+        self.tolerance = tolerance
+        self.active = 0
+        self.levels = {}  # 并发数 -> 测得的吞吐量（字节/秒）
+        self._epoch = 0   # 每个窗口结束时加1，之前开始的任务不计入新窗口
+        self._reset_window()
+        self._cond = threading.Condition()
+
+    def _reset_window(self):
+        self._window_bytes = 0
+        self._window_elapsed = 0.0
+        self._window_jobs = 0
+        self._window_start = None  # 本窗口第一个任务开始的时间
+
+    def _take_locked(self):
+        self.active += 1
+        if self._window_start is None:
+            self._window_start = time.monotonic()
+        return self._epoch
+
+    def free(self):
+        """当前空位数"""
+        with self._cond:
+            return max(0, self.limit - self.active)
+
+    def acquire(self, control=None):
+        """等待空位，返回凭据（传给release）；取消时返回None"""
+        with self._cond:
+            while self.active >= self.limit:
+                if control is not None and control.is_cancelled():
+                    return None
+                self._cond.wait(0.2)
+            return self._take_locked()
+
+    def try_acquire(self):
+        """有空位时占用并返回凭据，没有时立即返回None（调用方先处理其他卷的任务，不占用线程等待）"""
+        with self._cond:
+            if self.active >= self.limit:
+                return None
+            return self._take_locked()
+
+    def release(self, ticket, nbytes, elapsed):
+        """任务结束，计入本窗口的字节数和耗时（失败或已取消的任务传0，不计入吞吐量）"""
+        with self._cond:
+            self.active -= 1
+            if nbytes > 0 and ticket == self._epoch:
+                self._window_bytes += nbytes
+                self._window_elapsed += max(elapsed, 1e-3)
+                self._window_jobs += 1
+                if self._window_jobs >= max(self.window_jobs, self.limit):
+                    self._evaluate()
+            self._cond.notify_all()
+
+    def _evaluate(self):
+        old = self.limit
+        # 聚合吞吐量按实际经过时间计算，各任务的耗时只用于单位耗时
+        wall = max(time.monotonic() - self._window_start, 1e-3)
+        throughput = self._window_bytes / wall
+        latency = self._window_elapsed / (self._window_bytes / MB)
+        recorded = self.levels.get(old)
+        if recorded is not None and throughput < recorded * 0.5:
+            # 负载或存储状况变化，之前的记录作废
+            self.levels = {}
+            new = max(self.min_limit, old // 2)
+        else:
+            self.levels[old] = throughput if recorded is None else (recorded + throughput) / 2
+            below = self.levels.get(old - 1)
+            still_rising = below is None or self.levels[old] > below * (1 + self.tolerance)
+            if old < self.max_limit and old + 1 not in self.levels and still_rising:
+                new = old + 1
+            else:
+                top = max(self.levels.values())
+                best = min(n for n, tp in self.levels.items() if tp >= top * (1 - self.tolerance))
+                new = old + (best > old) - (best < old)
+        self._reset_window()
+        self._epoch += 1
+        if new == old:
+            return
+        self.limit = new
+        logger.info(f"并发调整 [{self.volume}]: {old} -> {new}（吞吐 {throughput / MB:.1f} MB/s，"
+                    f"每MB耗时 {latency * 1000:.1f} 毫秒）")
+        file_logger.info("并发调整", extra={'event': 'concurrency', 'fields': {
+            'volume': self.volume, 'old': old, 'new': new,
+            'throughput_mbps': round(throughput / MB, 2), 'latency_ms_per_mb': round(latency * 1000, 2)}})
+
+class ConcurrencyController:
+    """按卷管理并发限制；adaptive_workers关闭时固定为max_workers"""
+    def __init__(self, config_mgr):
+        self.max_workers = max(1, config_mgr.get('max_workers', 1))
+        self.adaptive = config_mgr.get('adaptive_workers', True)
+        self.min_workers = (min(self.max_workers, max(1, config_mgr.get('min_workers', 1)))
+                            if self.adaptive else self.max_workers)
+        self._limiters = {}   # 设备号 -> AdaptiveLimiter
+        self._dir_volumes = {}  # 目录 -> 设备号
+        self._lock = threading.Lock()
+
+    def limiter_for(self, directory: Path):
+        directory = str(directory)
+        with self._lock:
+            dev = self._dir_volumes.get(directory)
+            if dev is None:
+                try:
+                    dev, mount = volume_of(directory)
+                except OSError:
+                    dev, mount = None, directory
+                self._dir_volumes[directory] = dev
+                if dev not in self._limiters:
+                    self._limiters[dev] = AdaptiveLimiter(mount, self.min_workers, self.max_workers)
+            return self._limiters[dev]
+
+    def log_summary(self):
+        """批次结束时记录各卷最终稳定的并发数"""
+        if not self.adaptive:
+            return
+        for limiter in self._limiters.values():
+            logger.info(f"卷 {limiter.volume} 的并发数稳定在 {limiter.limit}")
@@ -17,6 +17,11 @@ class ConfigManager:
     DEFAULT_SUFFIX = '_meta'
     DEFAULT_SKIP_PATTERN = '^.*meta$'
     DEFAULT_PREVIEW_COUNT = 20  # 添加默认预览数量
+    # 扫描规则：按顺序判断，第一条命中的规则生效
+    DEFAULT_SCAN_RULES = [
+        {'action': 'exclude', 'dir_glob': '@eaDir'},
+        {'action': 'exclude', 'dir_glob': '.snapshots'},
+    ]
     VALID_CHARS = f"-_.{string.ascii_letters}{string.digits}"
     
     DEFAULT_CONFIG = {
@@ -29,7 +34,36 @@ class ConfigManager:
         'sync_xml': True,  # 默认同步处理.xml文件
         'cache_chosen_ass': True,  # 新增：记忆用户选择的ass同步状态
         'cache_chosen_xml': True,  # 新增：记忆用户选择的xml同步状态
-        'preview_count': DEFAULT_PREVIEW_COUNT  # 添加预览数量配置项
+        'preview_count': DEFAULT_PREVIEW_COUNT,  # 添加预览数量配置项
+        'ffmpeg_path': '',  # 指定ffmpeg路径，留空则依次查找PATH和打包的ffmpeg
+        'scan_rules': DEFAULT_SCAN_RULES,  # 目录/文件的包含排除规则
+        'scan_threads': 8,  # 扫描目录的并发线程数，网络存储可调大，1为单线程
+        'log_max_mb': 10,  # 单个日志文件大小上限（MB），超过后轮转
+        'log_backup_count': 5,  # 保留的历史日志文件数
+        'json_log': False,  # 是否额外输出JSON Lines结构化日志log.jsonl
+        'commit_batch_size': 16,  # 每多少个视频统一落盘一次（fsync）
+        'fsync_commits': True,  # 提交后是否fsync文件和目录
+        'mdat_recovery': True,  # 没有moov时尝试扫描mdat重建索引
+        'recovery_fps': 30,  # 重建索引时使用的帧率（mdat中没有时间戳）
+        'io_limit_mbps': 0,  # 读写限速（MB/s），0表示不限速
+        'io_schedule': [],  # 按时间段限速，如 [{"start": "08:00", "end": "20:00", "mbps": 50}]
+        'ffmpeg_nice': 0,  # ffmpeg的nice值（0~19，越大优先级越低；Windows映射为低优先级类）
+        'ffmpeg_ionice_class': '',  # ffmpeg的IO调度类：idle / best-effort，留空不设置（仅Linux）
+        'ffmpeg_ionice_level': 4,  # best-effort类的级别（0~7）
+        'ffmpeg_cpu_affinity': [],  # 限定ffmpeg可用的CPU编号，留空不限制（仅Linux）
+        'ffmpeg_cgroup': '',  # 把ffmpeg放入的cgroup目录，如 /sys/fs/cgroup/mp4recovery（仅Linux）
+        'root_queue': [],  # 待处理的根目录队列
+        'max_workers': 1,  # 同时处理的视频数上限（所有根目录共用）
+        'remux_engine': 'auto',  # 重封装后端：auto / ffmpeg / pyav / null
+        'pyav_max_mb': 256,  # auto时不超过该大小的文件使用进程内PyAV后端
+        'reflink_repair': False,  # 保留原视频时克隆原文件（reflink）并只修补头部，不支持时退回普通复制
+        'adaptive_workers': True,  # 按各卷实测吞吐量在min_workers和max_workers之间自动调整并发数
+        'min_workers': 1,  # 自适应并发的下限
+        'page_cache_hints': True,  # 顺序读预读并丢弃已处理的页缓存（posix_fadvise，仅Linux等支持的系统）
+        'service_queue_size': 10000,  # 常驻服务的队列容量，超出时拒绝提交（HTTP 429）
+        'repair_strategies': ['copy', 'tolerant', 'mdat_rebuild'],  # 依次尝试的修复方式（header_patch/copy/tolerant/mdat_rebuild），失败或校验不通过时换下一种
+        'concat_segments': False,  # 分段录制的系列（如 name_001.mp4、name_002.mp4）修复后一次拼接为一个视频
+        'segment_pattern': r'^(.+)_(\d{3})\.mp4$'  # 分段文件名规则：第1组为系列名，第2组为段号
     }
     
     def __init__(self, app_dir):
@@ -0,0 +1,252 @@
+from pathlib import Path
+from collections import deque
+import itertools
+import logging
+import os
+import socket
+import threading
+import time
+from core.http_api import JsonServer, post_json, get_json
+from core.tmp_dir_manager import TmpDirManager
+from core.job_queue import JobTable
+
+logger = logging.getLogger('mp4recovery')
+
+class Coordinator:
+    """协调者：持有扫描得到的任务列表，通过HTTP以租约方式分发给多台机器上的工作者
+
+    接口（均为JSON）:
+        POST /lease   {worker}                      -> {job: {id, path, [segments], lease, lease_seconds} | null, done}
+        POST /renew   {id, lease}                   -> {ok}
+        POST /report  {id, lease, result}           -> {ok}
+        GET  /status                                -> 各状态计数与结果列表
+    租约过期未续约的任务会重新入队，超过max_attempts次则记为失败。
+    files为JobTable且识别出分段系列时，每个系列是一个任务（path为首段，segments为按段号排序的全部段）。
+    """
+    def __init__(self, files, lease_seconds=300, max_attempts=3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.jobs = []
+        for path, segments in self._job_paths(files):
+            self.jobs.append({'id': len(self.jobs), 'path': path, 'segments': segments, 'state': 'pending',
+                              'attempts': 0, 'lease': None, 'worker': None, 'expires': 0.0, 'result': None})
+        self.pending = deque(job['id'] for job in self.jobs)
+        self._lock = threading.Lock()
+        self._lease_seq = itertools.count(1)
+        self._finished = 0
+        self.done_event = threading.Event()
+        self.server = None
+        if not self.jobs:
+            self.done_event.set()
+
+    @staticmethod
+    def _job_paths(files):
+        """产出 (路径, 分段系列的全部段或None)，系列的其余各段不单独成为任务"""
+        if not isinstance(files, JobTable):
+            for f in files:
+                yield str(f), None
+            return
+        for i in range(len(files)):
+            if i in files.series_members:
+                continue
+            indices = files.series.get(i)
+            yield files.path_str(i), [files.path_str(j) for j in indices] if indices else None
+
+    def lease(self, worker_id):
+        """取出一个待处理任务并发放租约，没有可发放的任务时返回None"""
+        with self._lock:
+            self._expire_locked()
+            if not self.pending:
+                return None
+            job = self.jobs[self.pending.popleft()]
+            job['state'] = 'leased'
+            job['lease'] = next(self._lease_seq)
+            job['worker'] = worker_id
+            job['attempts'] += 1
+            job['expires'] = time.monotonic() + self.lease_seconds
+            logger.info(f"任务 {job['id']} 租给 {worker_id}（第{job['attempts']}次）: {job['path']}")
+            leased = {'id': job['id'], 'path': job['path'], 'lease': job['lease'],
+                      'lease_seconds': self.lease_seconds}
+            if job['segments']:
+                leased['segments'] = job['segments']
+            return leased
+
+    def renew(self, job_id, lease_id):
+        """续约，租约已失效时返回False"""
+        with self._lock:
+            job = self._job(job_id)
+            if job is None or job['state'] != 'leased' or job['lease'] != lease_id:
+                return False
+            job['expires'] = time.monotonic() + self.lease_seconds
+            return True
+
+    def report(self, job_id, lease_id, result):
+        """接收处理结果。租约过期但尚未被其他工作者领走的迟到结果仍然接受"""
+        with self._lock:
+            job = self._job(job_id)
+            if job is None or job['state'] in ('done', 'failed'):
+                return False
+            if job['state'] == 'leased' and job['lease'] != lease_id:
+                logger.error(f"丢弃任务 {job_id} 的过期结果（租约已转给 {job['worker']}）")
+                return False
+            if job['state'] == 'pending':
+                self.pending.remove(job_id)
+            job['state'] = 'done' if result.get('success') else 'failed'
+            job['result'] = result
+            job['lease'] = None
+            self._finish_locked()
+            return True
+
+    def status(self):
+        with self._lock:
+            self._expire_locked()
+            counts = {}
+            for job in self.jobs:
+                counts[job['state']] = counts.get(job['state'], 0) + 1
+            return {'total': len(self.jobs), 'counts': counts,
+                    'done': self.done_event.is_set(),
+                    'results': [job['result'] for job in self.jobs if job['result']]}
+
+    def is_done(self):
+        return self.done_event.is_set()
+
+    def _job(self, job_id):
+        if isinstance(job_id, int) and 0 <= job_id < len(self.jobs):
+            return self.jobs[job_id]
+        return None
+
+    def _expire_locked(self):
+        """回收过期租约：重新入队，或超过重试次数后记为失败"""
+        now = time.monotonic()
+        for job in self.jobs:
+            if job['state'] != 'leased' or job['expires'] > now:
+                continue
+            logger.error(f"任务 {job['id']} 的租约已过期（工作者 {job['worker']}）")
+            job['lease'] = None
+            if job['attempts'] >= self.max_attempts:
+                job['state'] = 'failed'
+                job['result'] = {'path': job['path'], 'success': False,
+                                 'message': f"处理失败: 租约过期{job['attempts']}次: {job['path']}"}
+                self._finish_locked()
+            else:
+                job['state'] = 'pending'
+                self.pending.append(job['id'])
+
+    def _finish_locked(self):
+        self._finished += 1
+        if self._finished >= len(self.jobs):
+            self.done_event.set()
+
+    def routes(self):
+        def lease(body, _):
+            job = self.lease(str(body.get('worker', 'unknown')))
+            return 200, {'job': job, 'done': self.is_done()}
+
+        def renew(body, _):
+            return 200, {'ok': self.renew(body.get('id'), body.get('lease'))}
+
+        def report(body, _):
+            ok = self.report(body.get('id'), body.get('lease'), body.get('result') or {})
+            return (200 if ok else 409), {'ok': ok}
+
+        def status(body, _):
+            return 200, self.status()
+
+        return {('POST', '/lease'): lease, ('POST', '/renew'): renew,
+                ('POST', '/report'): report, ('GET', '/status'): status}
+
+    def serve(self, host='0.0.0.0', port=8765):
+        """在后台线程启动HTTP服务，返回JsonServer（port=0自动分配）"""
+        self.server = JsonServer(self.routes(), host, port).start()
+        logger.info(f"协调者已启动: {self.server.address}，共 {len(self.jobs)} 个任务")
+        return self.server
+
+    def wait(self, poll_interval=1.0):
+        """阻塞直到所有任务完成，期间定期回收过期租约"""
+        while not self.done_event.wait(poll_interval):
+            with self._lock:
+                self._expire_locked()
+
+    def stop(self):
+        if self.server:
+            self.server.stop()
+            self.server = None
+
+class DistributedWorker:
+    """工作者：从协调者领取任务，调用 VideoProcessor.process_video（分段系列为process_series）处理并回报结构化结果"""
+    def __init__(self, url, processor, worker_id=None, poll_interval=2.0):
+        self.url = url.rstrip('/')
+        self.processor = processor
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.tmp_manager = TmpDirManager()
+        self.processed = 0
+        self._stop = threading.Event()
+
+    def run(self):
+        """循环领取任务，直到协调者报告全部完成或被stop()"""
+        logger.info(f"工作者 {self.worker_id} 已连接协调者: {self.url}")
+        try:
+            while not self._stop.is_set():
+                try:
+                    status, reply = post_json(f"{self.url}/lease", {'worker': self.worker_id})
+                except OSError as e:
+                    logger.error(f"连接协调者失败: {str(e)}")
+                    self._stop.wait(self.poll_interval)
+                    continue
+                job = reply.get('job') if status == 200 else None
+                if job is None:
+                    if reply.get('done'):
+                        break
+                    # 剩余任务都在其他工作者手上，等待其完成或租约过期
+                    self._stop.wait(self.poll_interval)
+                    continue
+                self._run_job(job)
+        finally:
+            self.processor.flush_commits()
+            self.tmp_manager.cleanup_tmp_dirs()
+        logger.info(f"工作者 {self.worker_id} 退出，共处理 {self.processed} 个任务")
+        return self.processed
+
+    def stop(self):
+        self._stop.set()
+
+    def _run_job(self, job):
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, heartbeat_stop), daemon=True)
+        heartbeat.start()
+        path = Path(job['path'])
+        try:
+            tmp_dir = self.tmp_manager.get_tmp_dir(path.parent)
+            if job.get('segments'):
+                result = self.processor.process_series([Path(p) for p in job['segments']], tmp_dir).to_dict()
+            else:
+                result = self.processor.process_video(path, tmp_dir).to_dict()
+        except Exception as e:
+            result = {'path': str(path), 'success': False,
+                      'message': f"处理失败（原视频保留）: {path}，错误: {str(e)}"}
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+        result['worker'] = self.worker_id
+        self.processed += 1
+        try:
+            status, _ = post_json(f"{self.url}/report",
+                                  {'id': job['id'], 'lease': job['lease'], 'result': result})
+            if status != 200:
+                logger.error(f"协调者拒绝了任务 {job['id']} 的结果（租约已失效）")
+        except OSError as e:
+            logger.error(f"回报任务 {job['id']} 结果失败: {str(e)}")
+
+    def _heartbeat(self, job, stop):
+        """处理期间定期续约，防止长任务被误判为崩溃"""
+        interval = max(1.0, job.get('lease_seconds', 300) / 3)
+        while not stop.wait(interval):
+            try:
+                post_json(f"{self.url}/renew", {'id': job['id'], 'lease': job['lease']})
+            except OSError as e:
+                logger.error(f"续约任务 {job['id']} 失败: {str(e)}")
+
+def coordinator_status(url):
+    """查询协调者状态"""
+    return get_json(f"{url.rstrip('/')}/status")[1]
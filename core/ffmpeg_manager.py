@@ -1,46 +1,205 @@
 from pathlib import Path
+from PyQt5.QtCore import QThread, pyqtSignal
+import os
+import json
 import shutil
+import hashlib
 import logging
+import threading
+import subprocess
+import time
 
 logger = logging.getLogger('mp4recovery')
 
 class FFmpegManager:
-    def __init__(self, app_dir):
+    CACHE_FILE = 'ffmpeg_cache.json'
+    # 需要探测的能力：demuxer/muxer 名称
+    PROBE_DEMUXERS = ('mov,mp4,m4a,3gp,3g2,mj2', 'concat')
+    PROBE_MUXERS = ('mp4',)
+
+    def __init__(self, app_dir, config_mgr=None):
         self.user_dir = app_dir
-        self.ff = self.user_dir/'ffmpeg.exe'
-        
+        self.config_mgr = config_mgr
+        self.exe_name = 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg'
+        self.ff = self.user_dir/self.exe_name
+        self.cache_file = self.user_dir/self.CACHE_FILE
+        self.resolved_path = None  # 解析后的ffmpeg路径
+        self.version = None        # ffmpeg版本字符串
+        self.capabilities = {}     # 能力探测结果
+        self._lock = threading.Lock()
+
     def ensure_ffmpeg(self):
-        """确保FFmpeg可执行文件存在于用户目录"""
-        self.user_dir.mkdir(exist_ok=True)
-        
-        if not self.ff.exists():
-            try:
-                # 先从tools目录复制
-                tools_ff = Path(__file__).parent.parent/'tools'/'ffmpeg.exe'
-                if tools_ff.exists():
-                    shutil.copy(tools_ff, self.ff)
-                    logger.info(f"已从tools目录复制FFmpeg到: {self.ff}")
-                else:
-                    logger.error("tools目录下未找到ffmpeg.exe")
-                    return False
-            except Exception as e:
-                logger.error(f"复制FFmpeg时出错: {str(e)}")
+        """解析可用的FFmpeg（配置路径 > PATH > 打包副本），结果缓存，可重复调用"""
+        with self._lock:
+            if self.resolved_path:
+                return True
+            start = time.perf_counter()
+            self.user_dir.mkdir(exist_ok=True)
+            cache = self._load_cache()
+
+            path = (self._from_config() or self._from_path()
+                    or self._from_bundle(cache))
+            if not path:
+                logger.error(f"未找到可用的FFmpeg（可在配置中设置ffmpeg_path，或将{self.exe_name}加入PATH）")
                 return False
-                
-        # 清理临时目录
+
+            self._probe(path, cache)
+            self._save_cache(cache)
+            self._cleanup_temp()
+            self.resolved_path = path
+            logger.info(f"使用FFmpeg路径: {path}（{self.version or '版本未知'}，"
+                        f"解析耗时 {(time.perf_counter() - start) * 1000:.0f} ms）")
+            return True
+
+    def get_ffmpeg_path(self):
+        """获取FFmpeg可执行文件路径（未初始化时同步解析）"""
+        if not self.resolved_path:
+            self.ensure_ffmpeg()
+        return self.resolved_path
+
+    def _from_config(self):
+        """配置中指定的ffmpeg路径"""
+        if self.config_mgr is None:
+            return None
+        configured = self.config_mgr.get('ffmpeg_path', '')
+        if not configured:
+            return None
+        if Path(configured).is_file():
+            return str(configured)
+        logger.error(f"配置的ffmpeg_path不存在: {configured}")
+        return None
+
+    def _from_path(self):
+        """系统PATH中的ffmpeg"""
+        return shutil.which('ffmpeg')
+
+    def _from_bundle(self, cache):
+        """打包的ffmpeg：按大小/哈希校验用户目录中的副本，仅在不一致时复制"""
+        tools_ff = Path(__file__).parent.parent/'tools'/self.exe_name
+        if not tools_ff.exists():
+            if self.ff.exists():
+                return str(self.ff)
+            logger.error(f"tools目录下未找到{self.exe_name}")
+            return None
+
+        try:
+            bundle_stat = tools_ff.stat()
+            if self.ff.exists():
+                copy_stat = self.ff.stat()
+                record = cache.get('copy', {})
+                # 大小一致且副本自上次校验后未被改动，直接复用
+                if (copy_stat.st_size == bundle_stat.st_size
+                        and record.get('size') == copy_stat.st_size
+                        and record.get('mtime_ns') == copy_stat.st_mtime_ns):
+                    return str(self.ff)
+                if (copy_stat.st_size == bundle_stat.st_size
+                        and self._sha256(self.ff) == self._sha256(tools_ff)):
+                    self._record_copy(cache)
+                    return str(self.ff)
+
+            shutil.copy(tools_ff, self.ff)
+            self._record_copy(cache)
+            logger.info(f"已从tools目录复制FFmpeg到: {self.ff}")
+            return str(self.ff)
+        except Exception as e:
+            logger.error(f"复制FFmpeg时出错: {str(e)}")
+            return None
+
+    def _record_copy(self, cache):
+        st = self.ff.stat()
+        cache['copy'] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+    def _sha256(self, path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _probe(self, path, cache):
+        """探测版本与能力，按(路径, 大小, 修改时间)缓存"""
+        try:
+            st = Path(path).stat()
+            key = f"{path}|{st.st_size}|{st.st_mtime_ns}"
+        except OSError:
+            key = path
+        probe = cache.get('probe', {})
+        if probe.get('key') == key:
+            self.version = probe.get('version')
+            self.capabilities = probe.get('capabilities', {})
+            return
+
+        self.version = None
+        self.capabilities = {}
+        try:
+            out = self._run(path, '-version')
+            if out:
+                self.version = out.splitlines()[0].strip()
+            demuxers = self._parse_formats(self._run(path, '-demuxers'))
+            muxers = self._parse_formats(self._run(path, '-muxers'))
+            for name in self.PROBE_DEMUXERS:
+                self.capabilities[f'demux:{name}'] = name in demuxers
+            for name in self.PROBE_MUXERS:
+                self.capabilities[f'mux:{name}'] = name in muxers
+        except Exception as e:
+            logger.error(f"探测FFmpeg能力失败: {str(e)}")
+            return
+        cache['probe'] = {'key': key, 'version': self.version,
+                          'capabilities': self.capabilities}
+
+    def _run(self, path, *args):
+        startupinfo = None
+        if hasattr(subprocess, 'STARTUPINFO'):
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        result = subprocess.run([path, '-hide_banner', *args], capture_output=True,
+                                text=True, encoding='utf-8', errors='replace',
+                                startupinfo=startupinfo, timeout=10)
+        return result.stdout
+
+    @staticmethod
+    def _parse_formats(output):
+        """解析 -demuxers/-muxers 输出中的格式名"""
+        names = set()
+        for line in (output or '').splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and set(parts[0]) <= set('DE.d'):
+                names.add(parts[1])
+        return names
+
+    def _cleanup_temp(self):
+        """清理旧版本遗留的临时目录"""
         temp_dir = Path(__file__).parent/'temp'
         if temp_dir.exists():
             try:
-                temp_ff = temp_dir/'ffmpeg.exe'
+                temp_ff = temp_dir/self.exe_name
                 if temp_ff.exists():
                     temp_ff.unlink()
                     logger.info("已清理临时目录的FFmpeg")
             except Exception as e:
                 logger.error(f"清理临时文件时出错: {str(e)}")
-                
-        logger.info(f"使用FFmpeg路径: {self.ff}")    
-        return True
 
-    def get_ffmpeg_path(self):
-        """获取FFmpeg可执行文件路径"""
-        return str(self.ff) if self.ff.exists() else None
\ No newline at end of file
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save_cache(self, cache):
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=4, ensure_ascii=False)
+        except Exception as e:
+            logger.error(f"保存FFmpeg缓存失败: {str(e)}")
+
+class FFmpegInitWorker(QThread):
+    """在后台线程中解析FFmpeg，避免阻塞首个窗口的显示"""
+    ready = pyqtSignal(bool)
+
+    def __init__(self, ffmpeg_mgr):
+        super().__init__()
+        self.ffmpeg_mgr = ffmpeg_mgr
+
+    def run(self):
+        self.ready.emit(self.ffmpeg_mgr.ensure_ffmpeg())
@@ -0,0 +1,113 @@
+from pathlib import Path
+import logging
+import subprocess
+from core.job_control import JobCancelled, suspend_process, resume_process
+from core.io_hints import StreamHints
+
+logger = logging.getLogger('mp4recovery')
+
+POLL_INTERVAL = 0.2  # 轮询间隔（秒），决定暂停/取消的响应速度
+
+def run_ffmpeg(cmd, control=None, output_file=None, priority=None, input_file=None):
+    """运行ffmpeg并返回CompletedProcess（附带priority属性：实际生效的优先级）
+
+    有control时：子进程登记到control以便暂停/继续/取消；按输出文件的增长量计入限速，
+    超出配额时临时挂起子进程。取消时结束子进程并抛出JobCancelled。
+    有priority（ProcessPriority）时在子进程创建后立即应用nice/ionice/CPU亲和性/cgroup。
+    有input_file和output_file时按输出大小估计ffmpeg的读取位置（-c copy时两者基本一致），
+    对输入预读、对已处理的输入和已写出的输出建议丢弃页缓存。
+    """
+    # 关键：防止ffmpeg弹出cmd窗口
+    startupinfo = None
+    if hasattr(subprocess, 'STARTUPINFO'):
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8',  # 指定编码为UTF-8
+        errors='replace',
+        startupinfo=startupinfo,
+        **(priority.popen_kwargs() if priority is not None else {})
+    )
+    applied = {}
+    if priority is not None:
+        priority.apply(proc.pid)
+        applied = priority.applied(proc.pid)
+    if control is not None:
+        control.register(proc)
+    in_hints = out_hints = None
+    if input_file is not None and output_file is not None:
+        in_hints = StreamHints(input_file)
+    written = 0
+    try:
+        while True:
+            try:
+                stdout, stderr = proc.communicate(timeout=POLL_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if in_hints is not None:
+                out_hints = _advance_hints(in_hints, out_hints, Path(output_file))
+            if control is None:
+                continue
+            if control.is_cancelled():
+                proc.kill()
+                proc.communicate()
+                raise JobCancelled()
+            if output_file is not None:
+                written = _throttle(proc, control, Path(output_file), written)
+    finally:
+        if control is not None:
+            control.unregister(proc)
+        if in_hints is not None:
+            in_hints.close()
+        if out_hints is not None:
+            out_hints.close()
+    if control is not None and control.is_cancelled():
+        # 子进程被cancel()直接结束
+        raise JobCancelled()
+    result = subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+    result.priority = applied
+    return result
+
+def _advance_hints(in_hints, out_hints, output_file):
+    """按输出大小推进输入和输出的页缓存建议，输出文件出现后才打开"""
+    try:
+        size = output_file.stat().st_size
+    except OSError:
+        return out_hints
+    if out_hints is None:
+        out_hints = StreamHints(output_file, prefetch=False)
+    in_hints.advance(size)
+    out_hints.advance(size)
+    return out_hints
+
+def _throttle(proc, control, output_file, written):
+    """按输出增长量计入限速，需要等待时挂起子进程"""
+    try:
+        size = output_file.stat().st_size
+    except OSError:
+        return written
+    delay = control.throttle.debit(size - written) if size > written else 0.0
+    if delay > 0 and not control.is_paused():
+        try:
+            suspend_process(proc.pid)
+        except OSError:
+            return size
+        try:
+            while delay > 0 and not control.is_cancelled():
+                step = min(delay, POLL_INTERVAL)
+                control.wait_cancelled(step)
+                delay -= step
+        finally:
+            # 用户在此期间暂停了则保持挂起，由resume()统一恢复
+            if not control.is_paused() and proc.poll() is None:
+                try:
+                    resume_process(proc.pid)
+                except OSError:
+                    pass
+    return max(size, written)
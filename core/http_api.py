@@ -0,0 +1,131 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qs
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+import json
+import logging
+import os
+import socketserver
+import threading
+
+logger = logging.getLogger('mp4recovery')
+
+class JsonRequestHandler(BaseHTTPRequestHandler):
+    """简单的JSON请求处理器，按 (方法, 路径) 分发到 server.routes"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        path = self.path.split('?', 1)[0]
+        handler = self.server.routes.get((method, path))
+        if handler is None:
+            self.send_json(404, {'error': f'未知接口: {method} {path}'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+        except ValueError:
+            self.send_json(400, {'error': '请求体不是有效的JSON'})
+            return
+        if not isinstance(body, dict):
+            self.send_json(400, {'error': '请求体必须是JSON对象'})
+            return
+        try:
+            result = handler(body, self)
+        except Exception as e:
+            logger.error(f"处理请求 {method} {path} 失败: {str(e)}")
+            self.send_json(500, {'error': str(e)})
+            return
+        if result is not None:  # 返回None表示处理器已自行写出响应
+            status, payload = result
+            self.send_json(status, payload)
+
+    def query(self):
+        """URL查询参数，每个键取第一个值"""
+        return {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+
+    def address_string(self):
+        # Unix套接字没有客户端地址
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # 不输出到stderr，避免淹没日志
+        pass
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class UnixHTTPServer(ThreadingMixIn, socketserver.UnixStreamServer):
+        """监听Unix套接字的HTTP服务（本机进程间调用，可用 curl --unix-socket 访问）"""
+        daemon_threads = True
+else:
+    UnixHTTPServer = None
+
+class JsonServer:
+    """在后台线程中运行的JSON HTTP服务，port=0时自动分配端口；给出unix_path时改为监听Unix套接字"""
+    def __init__(self, routes, host='127.0.0.1', port=0, unix_path=None):
+        self.unix_path = unix_path
+        if unix_path:
+            if UnixHTTPServer is None:
+                raise OSError("当前系统不支持Unix套接字")
+            if os.path.exists(unix_path):
+                os.unlink(unix_path)  # 上次异常退出留下的套接字文件
+            self.httpd = UnixHTTPServer(unix_path, JsonRequestHandler)
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), JsonRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.routes = routes
+        self._thread = None
+
+    @property
+    def address(self):
+        if self.unix_path:
+            return f"unix:{self.unix_path}"
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+        if self.unix_path and os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)
+
+def post_json(url, payload, timeout=30):
+    """POST一个JSON请求并返回 (状态码, 响应JSON)"""
+    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    req = urlrequest.Request(url, data=data, method='POST',
+                             headers={'Content-Type': 'application/json'})
+    return _open(req, timeout)
+
+def get_json(url, timeout=30):
+    """GET一个JSON接口并返回 (状态码, 响应JSON)"""
+    return _open(urlrequest.Request(url), timeout)
+
+def _open(req, timeout):
+    try:
+        with urlrequest.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read() or b'{}')
+    except HTTPError as e:
+        try:
+            return e.code, json.loads(e.read() or b'{}')
+        except ValueError:
+            return e.code, {}
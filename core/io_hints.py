@@ -0,0 +1,121 @@
+import logging
+import os
+
+logger = logging.getLogger('mp4recovery')
+
+PAGE = 4096
+READAHEAD = 16 * 1024 * 1024  # 预读窗口
+COPY_CHUNK = 8 * 1024 * 1024
+WRITEBACK_LAG = 4  # 写出多少块后再次丢弃目标文件的页（第一次只是发起回写）
+SUPPORTED = hasattr(os, 'posix_fadvise')  # Windows/macOS没有posix_fadvise，所有建议都不生效
+enabled = SUPPORTED  # 由配置项page_cache_hints控制
+
+def set_enabled(value):
+    global enabled
+    enabled = bool(value) and SUPPORTED
+
+def advise(fd, offset, length, advice):
+    """posix_fadvise的包装，advice为 SEQUENTIAL / WILLNEED / DONTNEED
+
+    不支持或关闭时不做任何事，失败时忽略（只是建议）。
+    """
+    if not enabled or length < 0:
+        return
+    try:
+        os.posix_fadvise(fd, max(0, offset), length, getattr(os, f'POSIX_FADV_{advice}'))
+    except OSError:
+        pass
+
+def sequential(fd, readahead=READAHEAD):
+    """声明顺序读取并预读开头一段"""
+    if enabled:
+        advise(fd, 0, 0, 'SEQUENTIAL')
+        advise(fd, 0, readahead, 'WILLNEED')
+
+def drop(fd, start, end):
+    """把[start, end)内已处理完的页移出页缓存（脏页会先开始回写，写完后才能丢弃）"""
+    if enabled:
+        start = max(0, start - start % PAGE)
+        end -= end % PAGE
+        if end > start:
+            advise(fd, start, end - start, 'DONTNEED')
+
+def drop_file(path):
+    """整个文件移出页缓存，用于已落盘的输出"""
+    if not enabled:
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        advise(fd, 0, 0, 'DONTNEED')
+    finally:
+        os.close(fd)
+
+class StreamHints:
+    """跟随另一个进程（ffmpeg）的顺序处理进度给出预读/丢弃建议
+
+    页缓存按文件共享，所以用自己打开的描述符建议也对ffmpeg生效。
+    advance(pos)：预读pos之后的一个窗口，丢弃pos之前超出keep的部分；
+    prefetch为False时只丢弃（用于输出文件，促使已写完的部分尽早回写并释放）。
+    """
+    def __init__(self, path, prefetch=True, readahead=READAHEAD, keep=COPY_CHUNK):
+        self.fd = None
+        self.prefetch = prefetch
+        self.readahead = readahead
+        self.keep = keep
+        self._prefetched = 0
+        self._dropped = 0
+        if not enabled:
+            return
+        try:
+            self.fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        if prefetch:
+            sequential(self.fd, readahead)
+            self._prefetched = readahead
+
+    def advance(self, pos):
+        if self.fd is None:
+            return
+        if self.prefetch and pos + self.readahead // 2 > self._prefetched:
+            advise(self.fd, self._prefetched, pos + self.readahead - self._prefetched, 'WILLNEED')
+            self._prefetched = pos + self.readahead
+        end = pos - self.keep
+        if end > self._dropped:
+            drop(self.fd, self._dropped, end)
+            # 输出文件的脏页回写完成后才能丢弃，保留一段窗口在之后重复建议
+            settled = end if self.prefetch else end - self.keep * WRITEBACK_LAG
+            self._dropped = max(self._dropped, settled - settled % PAGE)
+
+    def close(self, drop_all=True):
+        if self.fd is None:
+            return
+        if drop_all:
+            advise(self.fd, 0, 0, 'DONTNEED')
+        os.close(self.fd)
+        self.fd = None
+
+def copy_file(src, dst, checkpoint=None, chunk=COPY_CHUNK):
+    """顺序复制并随进度丢弃源和目标已处理的页；checkpoint(n)用于暂停/取消/限速"""
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        sequential(fin.fileno())
+        buf = bytearray(chunk)
+        view = memoryview(buf)
+        pos = 0
+        while True:
+            n = fin.readinto(buf)
+            if not n:
+                break
+            fout.write(view[:n])
+            advise(fin.fileno(), pos + n, chunk, 'WILLNEED')
+            drop(fin.fileno(), pos, pos + n)
+            # 目标文件：刚写完的块先发起回写，滞后几块（回写完成后）再真正丢弃
+            fout.flush()
+            drop(fout.fileno(), pos, pos + n)
+            drop(fout.fileno(), pos - WRITEBACK_LAG * chunk, pos - (WRITEBACK_LAG - 1) * chunk)
+            pos += n
+            if checkpoint is not None:
+                checkpoint(n)
@@ -0,0 +1,173 @@
+from datetime import datetime
+import logging
+import os
+import signal
+import threading
+import time
+
+logger = logging.getLogger('mp4recovery')
+
+class JobCancelled(Exception):
+    """批处理被用户取消"""
+
+def suspend_process(pid):
+    """挂起子进程（POSIX用SIGSTOP，Windows用NtSuspendProcess）"""
+    if os.name == 'nt':
+        _nt_process_call(pid, 'NtSuspendProcess')
+    else:
+        os.kill(pid, signal.SIGSTOP)
+
+def resume_process(pid):
+    """恢复被挂起的子进程"""
+    if os.name == 'nt':
+        _nt_process_call(pid, 'NtResumeProcess')
+    else:
+        os.kill(pid, signal.SIGCONT)
+
+def _nt_process_call(pid, func):
+    import ctypes
+    PROCESS_SUSPEND_RESUME = 0x0800
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(PROCESS_SUSPEND_RESUME, False, pid)
+    if not handle:
+        raise OSError(f"无法打开进程 {pid}")
+    try:
+        getattr(ctypes.windll.ntdll, func)(handle)
+    finally:
+        kernel32.CloseHandle(handle)
+
+class BandwidthThrottle:
+    """按时间段生效的MB/s限速（令牌桶），0表示不限速
+
+    schedule 形如 [{'start': '08:00', 'end': '20:00', 'mbps': 50}]，
+    跨午夜的时间段（start > end）同样支持；不在任何时间段内时使用 default_mbps。
+    """
+    BURST_SECONDS = 1.0
+
+    def __init__(self, default_mbps=0, schedule=()):
+        self.default_mbps = default_mbps or 0
+        self.schedule = []
+        for item in schedule:
+            try:
+                self.schedule.append((self._minutes(item['start']), self._minutes(item['end']),
+                                      float(item.get('mbps', 0))))
+            except (KeyError, ValueError) as e:
+                logger.error(f"忽略无效的限速时间段 {item}: {str(e)}")
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _minutes(text):
+        hour, minute = text.split(':')
+        return int(hour) * 60 + int(minute)
+
+    def current_limit(self, now=None):
+        """当前生效的限速（字节/秒），0表示不限速"""
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, mbps in self.schedule:
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return mbps * 1024 * 1024
+        return self.default_mbps * 1024 * 1024
+
+    def debit(self, nbytes):
+        """记入已读写的字节数，返回为满足限速需要等待的秒数"""
+        limit = self.current_limit()
+        with self._lock:
+            now = time.monotonic()
+            if limit <= 0:
+                self._tokens = 0.0
+                self._last = now
+                return 0.0
+            self._tokens = min(limit * self.BURST_SECONDS,
+                               self._tokens + (now - self._last) * limit)
+            self._last = now
+            self._tokens -= nbytes
+            return -self._tokens / limit if self._tokens < 0 else 0.0
+
+class JobControl:
+    """一个批次的暂停/继续/取消控制，以及所有ffmpeg子进程和Python侧复制共用的限速"""
+    def __init__(self, config_mgr=None):
+        get = config_mgr.get if config_mgr is not None else (lambda key, default=None: default)
+        self.throttle = BandwidthThrottle(get('io_limit_mbps', 0), get('io_schedule', []))
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+        self._procs = set()
+        self._lock = threading.Lock()
+
+    def is_paused(self):
+        return not self._running.is_set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def wait_cancelled(self, timeout):
+        """等待至多timeout秒，期间被取消则立即返回True"""
+        return self._cancelled.wait(timeout)
+
+    def pause(self):
+        """暂停：立即挂起所有正在运行的ffmpeg子进程"""
+        self._running.clear()
+        with self._lock:
+            for proc in list(self._procs):
+                self._signal(proc, suspend_process)
+        logger.info("已暂停处理")
+
+    def resume(self):
+        self._running.set()
+        with self._lock:
+            for proc in list(self._procs):
+                self._signal(proc, resume_process)
+        logger.info("已继续处理")
+
+    def cancel(self):
+        """取消：结束正在运行的子进程，未开始的文件保留在待处理列表中"""
+        self._cancelled.set()
+        self._running.set()
+        with self._lock:
+            for proc in list(self._procs):
+                try:
+                    resume_process(proc.pid)
+                    proc.kill()
+                except OSError:
+                    pass
+        logger.info("已取消处理")
+
+    def register(self, proc):
+        with self._lock:
+            self._procs.add(proc)
+            if self.is_paused():
+                self._signal(proc, suspend_process)
+
+    def unregister(self, proc):
+        with self._lock:
+            self._procs.discard(proc)
+
+    def wait_if_paused(self):
+        """暂停期间阻塞，取消时抛出JobCancelled"""
+        while not self._running.wait(0.5):
+            pass
+        if self.is_cancelled():
+            raise JobCancelled()
+
+    def checkpoint(self, nbytes=0):
+        """Python侧读写每块数据后调用：处理暂停、取消和限速"""
+        self.wait_if_paused()
+        delay = self.throttle.debit(nbytes) if nbytes else 0.0
+        while delay > 0:
+            step = min(delay, 0.5)
+            if self.wait_cancelled(step):
+                raise JobCancelled()
+            delay -= step
+
+    @staticmethod
+    def _signal(proc, func):
+        if proc.poll() is not None:
+            return
+        try:
+            func(proc.pid)
+        except OSError as e:
+            logger.error(f"控制ffmpeg进程 {proc.pid} 失败: {str(e)}")
@@ -0,0 +1,359 @@
+from pathlib import Path
+from array import array
+from collections import deque
+import logging
+import os
+import threading
+
+logger = logging.getLogger('mp4recovery')
+
+def path_key(path):
+    """规范化路径用于去重：解析符号链接和相对路径，Windows下忽略大小写"""
+    return os.path.normcase(os.path.realpath(str(path)))
+
+def _covers(root_key, key):
+    """root_key 是否包含 key（相同或为其祖先目录）"""
+    if root_key == key:
+        return True
+    prefix = root_key if root_key.endswith(os.sep) else root_key + os.sep
+    return key.startswith(prefix)
+
+def normalize_roots(roots, recursive=True):
+    """规范化根目录列表：去重，递归时去掉被其他根目录包含的子目录，保持原有顺序"""
+    result = []
+    keys = []
+    for root in roots:
+        key = path_key(root)
+        if key in keys:
+            continue
+        if recursive and any(_covers(k, key) for k in keys):
+            continue
+        if recursive:
+            # 新根目录包含已有的根目录时，替换掉它们
+            kept = [(k, r) for k, r in zip(keys, result) if not _covers(key, k)]
+            keys = [k for k, _ in kept]
+            result = [r for _, r in kept]
+        keys.append(key)
+        result.append(str(root))
+    return result
+
+class RootQueue:
+    """持久化的根目录队列，保存在配置项 root_queue 中"""
+    def __init__(self, config_mgr):
+        self.config_mgr = config_mgr
+
+    @property
+    def roots(self):
+        return list(self.config_mgr.get('root_queue', []))
+
+    def add(self, root):
+        """加入根目录，已被队列中的目录覆盖时返回False"""
+        recursive = self.config_mgr.get('recursive', True)
+        before = self.roots
+        after = normalize_roots(before + [str(root)], recursive)
+        if after == before:
+            return False
+        self.config_mgr.set('root_queue', after)
+        return True
+
+    def clear(self):
+        self.config_mgr.set('root_queue', [])
+
+class JobTable:
+    """紧凑的任务表，百万级文件时代替Path列表
+
+    目录字符串只保存一份（按编号驻留），每个任务只占各列中的一项：
+    目录编号、文件名、大小、修改时间、状态；Path对象在取出任务时才创建。
+    按规范化路径去重：目录只解析一次，同目录下的文件按文件名判断。
+    """
+    PENDING, DONE, FAILED = 0, 1, 2
+
+    def __init__(self):
+        self.dirs = []               # 目录字符串，按编号索引
+        self._dir_ids = {}           # 目录字符串 -> 编号
+        self._dir_keys = []          # 目录编号 -> 规范化目录（去重用）
+        self._seen = {}              # 规范化目录 -> 已加入的文件名集合
+        self.dir_ids = array('I')
+        self.names = []
+        self.sizes = array('q')      # 未知时为-1
+        self.mtimes = array('d')
+        self.status = array('B')
+        self.series = {}             # 分段系列：首个任务编号 -> 按段号排序的全部任务编号
+        self.series_members = set()  # 随系列一起处理、不单独出队的任务编号
+
+    @classmethod
+    def from_paths(cls, paths):
+        table = cls()
+        table.extend(paths)
+        return table
+
+    @classmethod
+    def from_lines(cls, lines):
+        """从文件列表（每行一个路径）读取，忽略空行"""
+        table = cls()
+        for line in lines:
+            line = line.strip()
+            if line:
+                table.add_path(line)
+        return table
+
+    def add(self, directory, name, size=-1, mtime=0.0):
+        """加入一个任务，返回编号；已存在（规范化路径相同）时返回None"""
+        dir_id = self._dir_ids.get(directory)
+        dir_key = self._dir_keys[dir_id] if dir_id is not None else path_key(directory)
+        seen = self._seen.setdefault(dir_key, set())
+        key = os.path.normcase(name)
+        if key in seen:
+            return None
+        seen.add(key)
+        if dir_id is None:
+            dir_id = len(self.dirs)
+            self._dir_ids[directory] = dir_id
+            self.dirs.append(directory)
+            self._dir_keys.append(dir_key)
+        self.dir_ids.append(dir_id)
+        self.names.append(name)
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.status.append(self.PENDING)
+        return len(self.names) - 1
+
+    def add_path(self, path, size=-1, mtime=0.0):
+        directory, name = os.path.split(str(path))
+        return self.add(directory, name, size, mtime)
+
+    def add_entry(self, entry, with_stat=False):
+        """加入扫描得到的DirEntry；with_stat时记录大小和修改时间（DirEntry已缓存stat时没有额外开销）"""
+        size, mtime = -1, 0.0
+        if with_stat:
+            try:
+                st = entry.stat()
+                size, mtime = st.st_size, st.st_mtime
+            except OSError:
+                pass
+        return self.add_path(entry.path, size, mtime)
+
+    def extend(self, files):
+        """批量加入（另一个JobTable或路径序列），返回实际加入的数量"""
+        added = 0
+        if isinstance(files, JobTable):
+            for i in range(len(files)):
+                if self.add(files.dirs[files.dir_ids[i]], files.names[i],
+                            files.sizes[i], files.mtimes[i]) is not None:
+                    added += 1
+        else:
+            for f in files:
+                if self.add_path(f) is not None:
+                    added += 1
+        return added
+
+    def sort(self):
+        """按目录、文件名排序（并行扫描的产出顺序不确定，排序后结果确定）"""
+        # 先按目录分桶再在桶内按文件名排序，避免为每个任务创建排序键元组
+        buckets = [array('I') for _ in self.dirs]
+        for i, dir_id in enumerate(self.dir_ids):
+            buckets[dir_id].append(i)
+        dir_ids, names = self.dir_ids, self.names
+        order = array('I')
+        for dir_id in sorted(range(len(self.dirs)), key=self.dirs.__getitem__):
+            order.extend(sorted(buckets[dir_id], key=names.__getitem__))
+            buckets[dir_id] = None
+        self.dir_ids = array('I', (dir_ids[i] for i in order))
+        self.names = [names[i] for i in order]
+        self.sizes = array('q', (self.sizes[i] for i in order))
+        self.mtimes = array('d', (self.mtimes[i] for i in order))
+        self.status = array('B', (self.status[i] for i in order))
+        # 编号已变化，分段系列需重新识别
+        self.series = {}
+        self.series_members = set()
+
+    def group_series(self, pattern):
+        """按文件名规则识别分段录制的系列（如 name_001.mp4、name_002.mp4），返回系列数
+
+        pattern的第1组为系列名、第2组为段号；同一目录下系列名相同的两段及以上组成一个系列，
+        段号重复时无法确定顺序，不分组。系列以编号最小的任务为首，其余各段随首段一起处理。
+        编号在排序后才确定，需在sort()之后调用；处理过程中追加的文件不分组。
+        """
+        groups = {}
+        for i, name in enumerate(self.names):
+            m = pattern.match(name)
+            if not m or not m.group(1):
+                continue
+            try:
+                number = int(m.group(2))
+            except (TypeError, ValueError):
+                continue  # 规则的第2组不是纯数字，按单个文件处理
+            groups.setdefault((self.dir_ids[i], m.group(1)), []).append((number, i))
+        self.series = {}
+        self.series_members = set()
+        for segments in groups.values():
+            if len(segments) < 2 or len({n for n, _ in segments}) < len(segments):
+                continue
+            segments.sort()
+            indices = [i for _, i in segments]
+            head = min(indices)
+            self.series[head] = indices
+            self.series_members.update(i for i in indices if i != head)
+        return len(self.series)
+
+    def path_str(self, i):
+        return os.path.join(self.dirs[self.dir_ids[i]], self.names[i])
+
+    def path(self, i):
+        return Path(self.path_str(i))
+
+    def dir_paths(self):
+        """涉及的全部目录（Path），数量与目录数而不是文件数成正比"""
+        return [Path(d) for d in self.dirs]
+
+    def count(self, status):
+        return self.status.count(status)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        """按顺序产出路径字符串"""
+        for i in range(len(self.names)):
+            yield self.path_str(i)
+
+class JobQueue:
+    """线程安全的文件任务队列，按规范化路径去重，支持处理过程中追加
+
+    任务保存在JobTable中，队列只记录下一个待取出的编号，get()返回任务编号。
+    """
+    def __init__(self, files=()):
+        self.table = files if isinstance(files, JobTable) else JobTable.from_paths(files)
+        self._next = 0
+        self._in_flight = 0  # 已取出、尚未mark()的任务数
+        self._deferred = {}  # 键（卷的并发限制）-> 等该键有空位后再取出的任务编号
+        self._ready = set()  # 可能有空位的键，其暂缓的任务可以取出，直到再次暂缓（已满）为止
+        self._cond = threading.Condition()
+        self._finished = False  # 已取空并结束，不再接受追加
+
+    @property
+    def total(self):
+        return len(self.table)
+
+    def put_many(self, files):
+        """追加文件，返回实际加入（未重复）的数量；队列已结束时返回None"""
+        with self._cond:
+            if self._finished:
+                return None
+            added = self.table.extend(files)
+            self._cond.notify_all()
+        return added
+
+    def begin_append(self):
+        """登记一次进行中的追加（如后台扫描），到end_append()之前批次不会结束；批次已结束时返回False"""
+        with self._cond:
+            if self._finished:
+                return False
+            self._in_flight += 1
+            return True
+
+    def end_append(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """取出一个任务编号（优先取出键上已有任务结束的暂缓任务）；超时或队列已结束时返回None"""
+        with self._cond:
+            while True:
+                i = self._take_locked()
+                if i is not None:
+                    self._in_flight += 1
+                    return i
+                if self._finished or not self._cond.wait(timeout):
+                    return None
+
+    def _take_locked(self):
+        for key in self._ready:
+            waiting = self._deferred.get(key)
+            if waiting:
+                # 键保持就绪：空位有多个（任务结束或并发上调）时其他线程继续取出，已满时由defer()撤下
+                i = waiting.popleft()
+                if not waiting:
+                    del self._deferred[key]
+                return i
+        while self._next < len(self.table):
+            i = self._next
+            self._next += 1
+            if i not in self.table.series_members:
+                return i
+        return None
+
+    def defer(self, i, key):
+        """get()取出的任务暂时不能开始（key对应的卷并发已满）：放回队列，key有空位后再取出
+
+        key需提供free()（当前空位数）。在队列锁内重新检查：占用失败之后才释放的空位不会丢失。
+        """
+        with self._cond:
+            self._deferred.setdefault(key, deque()).append(i)
+            if key.free() > 0:
+                self._ready.add(key)
+            else:
+                self._ready.discard(key)
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def path(self, i):
+        with self._cond:
+            return self.table.path(i)
+
+    def series(self, i):
+        """任务i是分段系列的首段时返回按段号排序的全部段（Path），否则返回None"""
+        with self._cond:
+            indices = self.table.series.get(i)
+            return [self.table.path(j) for j in indices] if indices else None
+
+    def mark(self, i, status, key=None):
+        """get()取出的任务结束时调用：记录状态（分段系列的各段一起记录，也可传与各段对应的状态列表），已取消未处理的传PENDING
+
+        key为任务占用的键（卷的并发限制），须在释放其名额之后调用；该键上暂缓的任务随后可以取出，
+        并发上调后有多个空位时依次取出多个。
+        """
+        with self._cond:
+            indices = self.table.series.get(i, (i,))
+            # 分段系列逐段处理时可按段分别传入状态
+            statuses = status if isinstance(status, (list, tuple)) else [status] * len(indices)
+            for j, st in zip(indices, statuses):
+                self.table.status[j] = st
+            self._in_flight -= 1
+            if key is not None:
+                self._ready.add(key)
+            self._cond.notify_all()
+
+    def finish_if_empty(self):
+        """没有待取出、正在处理的任务和进行中的追加时标记为结束（之后不再接受追加），返回是否已结束
+
+        正在处理的任务在get()中即已计入，不会在取出与开始处理之间被误判为空。
+        """
+        with self._cond:
+            if self._next >= len(self.table) and self._in_flight == 0:
+                if self._deferred:
+                    # 没有任务在处理，暂缓的任务都可以重新尝试
+                    self._ready.update(self._deferred)
+                    self._cond.notify_all()
+                    return False
+                self._finished = True
+                self._cond.notify_all()
+            return self._finished
+
+    def drain(self):
+        """取出剩余的全部文件（路径字符串），未处理系列的各段随首段一起取出"""
+        with self._cond:
+            table = self.table
+            pending = [i for waiting in self._deferred.values() for i in waiting]
+            pending.extend(i for i in range(self._next, len(table)) if i not in table.series_members)
+            items = []
+            for i in pending:
+                items.extend(table.path_str(j) for j in table.series.get(i, (i,)))
+            self._deferred.clear()
+            self._next = len(table)
+            return items
+
+    def __len__(self):
+        with self._cond:
+            return len(self.table) - self._next + sum(len(w) for w in self._deferred.values())
@@ -0,0 +1,629 @@
+from pathlib import Path
+from abc import ABC, abstractmethod
+from array import array
+import logging
+import mmap
+import re
+import struct
+import sys
+from core import io_hints
+
+logger = logging.getLogger('mp4recovery')
+
+class RecoveryError(Exception):
+    """无法从mdat重建索引"""
+
+# ---------------------------------------------------------------------------
+# MP4 box 读写
+# ---------------------------------------------------------------------------
+
+def iter_boxes(buf, start, end):
+    """遍历[start, end)内的box，产出 (类型, 起始偏移, 头长度, 总长度)，截断的box按到end为止处理"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buf, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                break
+            size = struct.unpack_from('>Q', buf, pos + 8)[0]
+            header = 16
+        if size == 0:
+            # 32位或64位长度为0都表示延伸到文件末尾（ISO BMFF）
+            size = end - pos
+        if size < header:
+            break
+        yield box_type, pos, header, min(size, end - pos)
+        pos += size
+
+def box(box_type, *payload):
+    data = b''.join(payload)
+    return struct.pack('>I4s', 8 + len(data), box_type) + data
+
+def full_box(box_type, version, flags, *payload):
+    return box(box_type, struct.pack('>I', (version << 24) | flags), *payload)
+
+def _be_bytes(values):
+    """把array按大端字节序输出"""
+    if _SWAP:
+        values.byteswap()
+    return values.tobytes()
+
+_SWAP = sys.byteorder == 'little'  # array需转换为大端字节序
+_MATRIX = struct.pack('>9I', 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+
+# ---------------------------------------------------------------------------
+# 码流解析
+# ---------------------------------------------------------------------------
+
+def unescape_rbsp(nal):
+    """去掉防竞争字节 00 00 03"""
+    return nal.replace(b'\x00\x00\x03', b'\x00\x00')
+
+class BitReader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def u(self, n):
+        value = 0
+        for _ in range(n):
+            byte = self.data[self.pos >> 3]
+            value = (value << 1) | ((byte >> (7 - (self.pos & 7))) & 1)
+            self.pos += 1
+        return value
+
+    def ue(self):
+        zeros = 0
+        while self.u(1) == 0:
+            zeros += 1
+            if zeros > 31:
+                raise ValueError("指数哥伦布码无效")
+        return (1 << zeros) - 1 + self.u(zeros)
+
+    def se(self):
+        v = self.ue()
+        return (v + 1) // 2 if v & 1 else -(v // 2)
+
+_AVC_HIGH_PROFILES = (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135)
+
+def parse_avc_sps(sps):
+    """解析H.264 SPS，返回 (宽, 高)"""
+    r = BitReader(unescape_rbsp(sps))
+    r.u(8)  # NAL头
+    profile_idc = r.u(8)
+    r.u(16)  # constraint_flags + level_idc
+    r.ue()   # seq_parameter_set_id
+    chroma_format_idc = 1
+    if profile_idc in _AVC_HIGH_PROFILES:
+        chroma_format_idc = r.ue()
+        if chroma_format_idc == 3:
+            r.u(1)
+        r.ue()
+        r.ue()
+        r.u(1)
+        if r.u(1):  # seq_scaling_matrix_present_flag
+            for i in range(8 if chroma_format_idc != 3 else 12):
+                if r.u(1):
+                    size = 16 if i < 6 else 64
+                    last, nxt = 8, 8
+                    for _ in range(size):
+                        if nxt != 0:
+                            nxt = (last + r.se() + 256) % 256
+                        last = nxt if nxt != 0 else last
+    r.ue()  # log2_max_frame_num_minus4
+    poc_type = r.ue()
+    if poc_type == 0:
+        r.ue()
+    elif poc_type == 1:
+        r.u(1)
+        r.se()
+        r.se()
+        for _ in range(r.ue()):
+            r.se()
+    r.ue()   # max_num_ref_frames
+    r.u(1)
+    width_mbs = r.ue() + 1
+    height_units = r.ue() + 1
+    frame_mbs_only = r.u(1)
+    if not frame_mbs_only:
+        r.u(1)
+    r.u(1)
+    crop = (0, 0, 0, 0)
+    if r.u(1):
+        crop = (r.ue(), r.ue(), r.ue(), r.ue())
+    crop_x, crop_y = {0: (1, 1), 1: (2, 2), 2: (2, 1), 3: (1, 1)}.get(chroma_format_idc, (2, 2))
+    crop_y *= 2 - frame_mbs_only
+    width = width_mbs * 16 - crop_x * (crop[0] + crop[1])
+    height = (2 - frame_mbs_only) * height_units * 16 - crop_y * (crop[2] + crop[3])
+    return width, height
+
+def parse_hevc_sps(sps):
+    """解析H.265 SPS，返回 (宽, 高, chroma_format_idc, 亮度位深-8, 色度位深-8, general_profile等12字节)"""
+    rbsp = unescape_rbsp(sps)
+    r = BitReader(rbsp)
+    r.u(16)  # NAL头
+    r.u(4)
+    max_sub_layers_minus1 = r.u(3)
+    r.u(1)
+    general = bytes(rbsp[3:15])
+    r.u(96)
+    sub_profile = []
+    for _ in range(max_sub_layers_minus1):
+        sub_profile.append((r.u(1), r.u(1)))
+    if max_sub_layers_minus1 > 0:
+        for _ in range(max_sub_layers_minus1, 8):
+            r.u(2)
+    for profile_present, level_present in sub_profile:
+        if profile_present:
+            r.u(88)
+        if level_present:
+            r.u(8)
+    r.ue()  # sps_seq_parameter_set_id
+    chroma_format_idc = r.ue()
+    if chroma_format_idc == 3:
+        r.u(1)
+    width = r.ue()
+    height = r.ue()
+    if r.u(1):  # conformance_window_flag
+        sub_w = 2 if chroma_format_idc in (1, 2) else 1
+        sub_h = 2 if chroma_format_idc == 1 else 1
+        left, right, top, bottom = r.ue(), r.ue(), r.ue(), r.ue()
+        width -= sub_w * (left + right)
+        height -= sub_h * (top + bottom)
+    return width, height, chroma_format_idc, r.ue(), r.ue(), general
+
+# ADTS采样率表
+_AAC_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050,
+              16000, 12000, 11025, 8000, 7350)
+
+def parse_adts(buf, pos, end):
+    """解析ADTS头，返回 (帧长, 头长, profile, 采样率索引, 声道数)，不是有效ADTS时返回None"""
+    if pos + 7 > end or buf[pos] != 0xFF or (buf[pos + 1] & 0xF6) != 0xF0:
+        return None
+    b1, b2, b3, b4, b5 = buf[pos + 1], buf[pos + 2], buf[pos + 3], buf[pos + 4], buf[pos + 5]
+    header_len = 7 if b1 & 1 else 9
+    sfi = (b2 >> 2) & 0x0F
+    frame_len = ((b3 & 0x03) << 11) | (b4 << 3) | (b5 >> 5)
+    if sfi >= len(_AAC_RATES) or frame_len <= header_len or pos + frame_len > end:
+        return None
+    return frame_len, header_len, (b2 >> 6) & 0x03, sfi, ((b2 & 0x01) << 2) | (b3 >> 6)
+
+class _Codec(ABC):
+    """长度前缀NAL的编码相关规则"""
+    name = ''
+    header_bytes = 1
+    resync = None
+
+    @abstractmethod
+    def nal_type(self, buf, pos):
+        """pos处NAL头的类型，不像合法NAL头时返回None"""
+
+class _AvcCodec(_Codec):
+    name = 'h264'
+    header_bytes = 1
+    # 长度前缀(4字节，首字节为0) + 常见NAL头
+    resync = re.compile(rb'\x00[\x00-\xff]{3}[\x01\x21\x41\x61\x25\x45\x65\x06\x27\x47\x67\x28\x48\x68\x09]', re.S)
+    SPS, PPS = 7, 8
+
+    def nal_type(self, buf, pos):
+        h = buf[pos]
+        if h & 0x80:
+            return None
+        t = h & 0x1F
+        ref = h & 0x60
+        if t in (1, 5, 7, 8) and (ref or t == 1):
+            return t
+        if t in (6, 9, 10, 11, 12) and not ref:
+            return t
+        return None
+
+    def is_vcl(self, t):
+        return t in (1, 5)
+
+    def is_key(self, t):
+        return t == 5
+
+    def first_slice(self, buf, pos):
+        # first_mb_in_slice == 0 编码为单个比特1
+        return bool(buf[pos + 1] & 0x80)
+
+    def starts_au(self, t):
+        return t in (6, 7, 8, 9)
+
+class _HevcCodec(_Codec):
+    name = 'h265'
+    header_bytes = 2
+    resync = re.compile(rb'\x00[\x00-\xff]{3}[\x00-\x13\x20-\x2b\x40\x42\x44\x46\x4e\x50]\x01', re.S)
+    VPS, SPS, PPS = 32, 33, 34
+
+    def nal_type(self, buf, pos):
+        h0, h1 = buf[pos], buf[pos + 1]
+        if h0 & 0x81 or h1 & 0xF8 or not h1 & 0x07:
+            return None
+        t = (h0 >> 1) & 0x3F
+        if t <= 9 or 16 <= t <= 21 or 32 <= t <= 40:
+            return t
+        return None
+
+    def is_vcl(self, t):
+        return t < 32
+
+    def is_key(self, t):
+        return 16 <= t <= 23
+
+    def first_slice(self, buf, pos):
+        return bool(buf[pos + 2] & 0x80)
+
+    def starts_au(self, t):
+        return t in (32, 33, 34, 35, 39)
+
+_ADTS_RESYNC = re.compile(rb'\xff[\xf0\xf1\xf8\xf9]')
+
+# ---------------------------------------------------------------------------
+# 恢复引擎
+# ---------------------------------------------------------------------------
+
+class MdatRecovery:
+    """内存映射原文件，不解码地遍历mdat，按长度前缀找出H.264/H.265 NAL和ADTS AAC帧，
+    重建 stsz/stco/stts/stss 并写出带新moov的文件
+
+    只保存每个样本的偏移和大小（array），内存占用与样本数成正比，与文件大小无关；
+    已扫描过的映射页会及时释放。没有ADTS头的原始AAC无法逐帧定位，会被跳过（只恢复视频）。
+    """
+    SEARCH_LIMIT = 16 * 1024 * 1024    # 探测编码时搜索的范围
+    RESYNC_WINDOW = 4 * 1024 * 1024    # 失步后每次向前搜索的窗口
+    RELEASE_STEP = 64 * 1024 * 1024    # 每扫描多少字节释放一次已用的映射页（同时处理暂停/取消/限速）
+    COPY_CHUNK = 8 * 1024 * 1024
+
+    def __init__(self, input_file, fps=30.0):
+        self.input_file = Path(input_file)
+        self.fps = fps
+        self.codec = None
+        self.params = {}       # NAL类型 -> 首个参数集字节
+        self.video_offsets = array('Q')
+        self.video_sizes = array('I')
+        self.keyframes = array('I')   # 1起始的关键帧样本序号
+        self.audio_offsets = array('Q')
+        self.audio_sizes = array('I')
+        self.audio_config = None      # (profile, 采样率索引, 声道数)
+        self.skipped_bytes = 0
+        self.data_start = 0
+        self.data_end = 0
+        self._fd = None
+        self._checkpoint = None
+
+    def recover(self, output_file, copy_range=None, checkpoint=None):
+        """扫描并写出恢复后的文件，返回统计信息
+
+        copy_range(out, mm, start, end)可替换默认的数据复制；checkpoint(n)在扫描过程中
+        按已读取的字节数调用，用于暂停/取消/限速（复制阶段由copy_range自行处理）。
+        """
+        self._checkpoint = checkpoint
+        with open(self.input_file, 'rb') as f:
+            if f.seek(0, 2) == 0:
+                raise RecoveryError("文件为空")
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._fd = f.fileno()
+            try:
+                if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                io_hints.sequential(self._fd)
+                start, end = self._find_mdat(mm)
+                self.codec = self._detect_codec(mm, start, end)
+                self._scan(mm, start, end)
+                if not self.video_sizes:
+                    raise RecoveryError("mdat中没有找到可用的视频帧")
+                for t in self._required_params():
+                    if t not in self.params:
+                        raise RecoveryError("mdat中没有找到完整的参数集（SPS/PPS）")
+                self._write(mm, Path(output_file), copy_range)
+            finally:
+                mm.close()
+                self._fd = None
+        stats = {
+            'codec': self.codec.name,
+            'video_samples': len(self.video_sizes),
+            'keyframes': len(self.keyframes),
+            'audio_samples': len(self.audio_sizes),
+            'skipped_bytes': self.skipped_bytes,
+            'duration': len(self.video_sizes) / self.fps,
+        }
+        logger.info(f"已从mdat重建索引: {self.input_file}，{stats}")
+        return stats
+
+    def _find_mdat(self, mm):
+        size = len(mm)
+        for box_type, pos, header, box_size in iter_boxes(mm, 0, size):
+            if box_type == b'mdat':
+                return pos + header, pos + box_size
+        raise RecoveryError("未找到mdat")
+
+    def _detect_codec(self, mm, start, end):
+        limit = min(end, start + self.SEARCH_LIMIT)
+        candidates = []
+        for codec, ps in ((_AvcCodec(), _AvcCodec.SPS), (_HevcCodec(), _HevcCodec.SPS)):
+            pos = start
+            while True:
+                m = codec.resync.search(mm, pos, limit)
+                if not m:
+                    break
+                p = m.start()
+                length = self._nal_length(mm, p, end, codec)
+                if length and codec.nal_type(mm, p + 4) == ps and self._chain_ok(mm, p + 4 + length, end, codec):
+                    candidates.append((p, codec))
+                    break
+                pos = p + 1
+        if not candidates:
+            raise RecoveryError("无法识别视频编码（未找到H.264/H.265参数集）")
+        return min(candidates, key=lambda c: c[0])[1]
+
+    def _required_params(self):
+        if isinstance(self.codec, _HevcCodec):
+            return (_HevcCodec.VPS, _HevcCodec.SPS, _HevcCodec.PPS)
+        return (_AvcCodec.SPS, _AvcCodec.PPS)
+
+    def _nal_length(self, mm, pos, end, codec):
+        """pos处是有效的长度前缀NAL时返回其长度"""
+        if pos + 4 + codec.header_bytes + 1 > end:
+            return 0
+        length = struct.unpack_from('>I', mm, pos)[0]
+        if length <= codec.header_bytes or pos + 4 + length > end:
+            return 0
+        return length if codec.nal_type(mm, pos + 4) is not None else 0
+
+    def _chain_ok(self, mm, pos, end, codec):
+        """失步后找到的候选位置，要求其后紧跟的也是有效单元（或到达末尾）"""
+        return (pos >= end or self._nal_length(mm, pos, end, codec) > 0
+                or parse_adts(mm, pos, end) is not None)
+
+    def _scan(self, mm, start, end):
+        codec = self.codec
+        pos = start
+        au_start = -1     # 当前访问单元的起始偏移
+        au_has_vcl = False
+        au_key = False
+        last_used = start
+        released = start
+        next_release = start + self.RELEASE_STEP
+        required = self._required_params()
+
+        def close_au(at):
+            nonlocal au_start, au_has_vcl, au_key
+            if au_start >= 0 and au_has_vcl:
+                self.video_offsets.append(au_start)
+                self.video_sizes.append(at - au_start)
+                if au_key:
+                    self.keyframes.append(len(self.video_sizes))
+            au_start, au_has_vcl, au_key = -1, False, False
+
+        while pos < end:
+            if pos >= next_release:
+                self._release(mm, released, pos)
+                if self._checkpoint is not None:
+                    self._checkpoint(pos - released)
+                released = pos
+                next_release = pos + self.RELEASE_STEP
+            length = self._nal_length(mm, pos, end, codec)
+            if length:
+                nal = pos + 4
+                t = codec.nal_type(mm, nal)
+                if codec.is_vcl(t):
+                    if au_has_vcl and codec.first_slice(mm, nal):
+                        close_au(pos)
+                    if au_start < 0:
+                        au_start = pos
+                    au_has_vcl = True
+                    au_key = au_key or codec.is_key(t)
+                else:
+                    if au_has_vcl and codec.starts_au(t):
+                        close_au(pos)
+                    if au_start < 0:
+                        au_start = pos
+                    if t in required and t not in self.params:
+                        self.params[t] = bytes(mm[nal:nal + length])
+                pos = nal + length
+                last_used = pos
+                continue
+
+            # 不是视频NAL，访问单元在此结束
+            close_au(pos)
+            adts = parse_adts(mm, pos, end)
+            if adts is not None:
+                frame_len, header_len, profile, sfi, channels = adts
+                if self.audio_config is None:
+                    self.audio_config = (profile, sfi, channels)
+                self.audio_offsets.append(pos + header_len)
+                self.audio_sizes.append(frame_len - header_len)
+                pos += frame_len
+                last_used = pos
+                continue
+
+            resume = self._resync(mm, pos, end)
+            self.skipped_bytes += resume - pos
+            pos = resume
+
+        close_au(pos)
+        if self._checkpoint is not None:
+            self._checkpoint(pos - released)
+        self.data_start = start
+        self.data_end = last_used
+
+    def _resync(self, mm, pos, end):
+        """失步后向前搜索下一个可信的视频NAL或ADTS帧"""
+        codec = self.codec
+        search = pos + 1
+        while search < end:
+            limit = min(end, search + self.RESYNC_WINDOW)
+            best = None
+            for pattern in (codec.resync, _ADTS_RESYNC):
+                scan = search
+                while True:
+                    m = pattern.search(mm, scan, limit)
+                    if not m or (best is not None and m.start() >= best):
+                        break
+                    p = m.start()
+                    length = self._nal_length(mm, p, end, codec)
+                    if length and self._chain_ok(mm, p + 4 + length, end, codec):
+                        best = p
+                        break
+                    adts = parse_adts(mm, p, end)
+                    if adts and self._chain_ok(mm, p + adts[0], end, codec):
+                        best = p
+                        break
+                    scan = p + 1
+            if best is not None:
+                return best
+            if self._checkpoint is not None:
+                # 跳过大段无法识别的数据时也能暂停/取消，字节数在_scan中计入
+                self._checkpoint(0)
+            search = limit
+        return end
+
+    def _release(self, mm, start, pos):
+        """释放[start, pos)内已用完的映射页并移出页缓存，保持内存和页缓存占用有界"""
+        if self._fd is not None:
+            io_hints.drop(self._fd, start, pos)
+        if not hasattr(mm, 'madvise') or not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        begin = start - start % mmap.PAGESIZE
+        stop = pos - pos % mmap.PAGESIZE
+        if stop > begin:
+            try:
+                mm.madvise(mmap.MADV_DONTNEED, begin, stop - begin)
+            except OSError:
+                pass
+
+    # -----------------------------------------------------------------------
+    # 输出
+    # -----------------------------------------------------------------------
+
+    def _write(self, mm, output_file, copy_range):
+        payload_len = self.data_end - self.data_start
+        ftyp = box(b'ftyp', b'isom', struct.pack('>I', 0x200), b'isomiso2mp41',
+                   b'avc1' if self.codec.name == 'h264' else b'hvc1')
+        if payload_len + 8 > 0xFFFFFFFF:
+            mdat_header = struct.pack('>I4sQ', 1, b'mdat', payload_len + 16)
+        else:
+            mdat_header = struct.pack('>I4s', payload_len + 8, b'mdat')
+        delta = len(ftyp) + len(mdat_header) - self.data_start
+
+        with open(output_file, 'wb') as out:
+            out.write(ftyp)
+            out.write(mdat_header)
+            pos = self.data_start
+            while pos < self.data_end:
+                n = min(self.COPY_CHUNK, self.data_end - pos)
+                io_hints.advise(self._fd, pos + n, self.COPY_CHUNK, 'WILLNEED')
+                if copy_range is not None:
+                    copy_range(out, mm, pos, pos + n)
+                else:
+                    out.write(mm[pos:pos + n])
+                self._release(mm, pos, pos + n)
+                # 输出：刚写完的块先发起回写，滞后几块（回写完成后）再真正丢弃
+                written = out.tell()
+                out.flush()
+                io_hints.drop(out.fileno(), written - n, written)
+                lag = io_hints.WRITEBACK_LAG * self.COPY_CHUNK
+                io_hints.drop(out.fileno(), written - lag - self.COPY_CHUNK, written - lag)
+                pos += n
+            out.write(self._build_moov(delta))
+
+    def _build_moov(self, delta):
+        fps_scale = round(self.fps * 1000)
+        video_duration_ms = len(self.video_sizes) * 1000 // self.fps
+        tracks = [self._video_trak(delta, fps_scale, video_duration_ms)]
+        duration_ms = video_duration_ms
+        if self.audio_sizes and self.audio_config:
+            rate = _AAC_RATES[self.audio_config[1]]
+            audio_duration_ms = len(self.audio_sizes) * 1024 * 1000 // rate
+            tracks.append(self._audio_trak(delta, rate, audio_duration_ms))
+            duration_ms = max(duration_ms, audio_duration_ms)
+        mvhd = full_box(b'mvhd', 0, 0, struct.pack(
+            '>IIIIIH10x', 0, 0, 1000, int(duration_ms), 0x00010000, 0x0100),
+            _MATRIX, bytes(24), struct.pack('>I', len(tracks) + 1))
+        return box(b'moov', mvhd, *tracks)
+
+    def _tkhd(self, track_id, duration_ms, audio, width=0, height=0):
+        return full_box(b'tkhd', 0, 3, struct.pack(
+            '>IIIIIQHHHH', 0, 0, track_id, 0, int(duration_ms), 0, 0, 0,
+            0x0100 if audio else 0, 0), _MATRIX, struct.pack('>II', width << 16, height << 16))
+
+    def _mdia(self, handler, name, timescale, duration, minf_header, stbl):
+        mdhd = full_box(b'mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, timescale, int(duration), 0x55C4, 0))
+        hdlr = full_box(b'hdlr', 0, 0, struct.pack('>I4s12x', 0, handler), name.encode() + b'\x00')
+        dinf = box(b'dinf', full_box(b'dref', 0, 0, struct.pack('>I', 1), full_box(b'url ', 0, 1)))
+        return box(b'mdia', mdhd, hdlr, box(b'minf', minf_header, dinf, stbl))
+
+    def _sample_tables(self, offsets, sizes, delta, sample_delta):
+        count = len(sizes)
+        stts = full_box(b'stts', 0, 0, struct.pack('>III', 1, count, sample_delta))
+        stsz = full_box(b'stsz', 0, 0, struct.pack('>II', 0, count), _be_bytes(array('I', sizes)))
+        stsc = full_box(b'stsc', 0, 0, struct.pack('>IIII', 1, 1, 1, 1))
+        if count and offsets[-1] + delta > 0xFFFFFFFF:
+            stco = full_box(b'co64', 0, 0, struct.pack('>I', count),
+                            _be_bytes(array('Q', (o + delta for o in offsets))))
+        else:
+            stco = full_box(b'stco', 0, 0, struct.pack('>I', count),
+                            _be_bytes(array('I', (o + delta for o in offsets))))
+        return stts, stsz, stsc, stco
+
+    def _video_trak(self, delta, fps_scale, duration_ms):
+        if isinstance(self.codec, _HevcCodec):
+            try:
+                width, height, chroma, bd_luma, bd_chroma, general = parse_hevc_sps(self.params[_HevcCodec.SPS])
+            except (IndexError, ValueError):
+                raise RecoveryError("无法解析H.265 SPS")
+            config = box(b'hvcC', self._hvcc(general, chroma, bd_luma, bd_chroma))
+            entry_type = b'hvc1'
+        else:
+            try:
+                width, height = parse_avc_sps(self.params[_AvcCodec.SPS])
+            except (IndexError, ValueError):
+                width, height = 0, 0
+            config = box(b'avcC', self._avcc())
+            entry_type = b'avc1'
+        entry = box(entry_type, bytes(6), struct.pack('>H', 1), bytes(16),
+                    struct.pack('>HHIIIH', width, height, 0x00480000, 0x00480000, 0, 1),
+                    bytes(32), struct.pack('>Hh', 0x0018, -1), config)
+        stsd = full_box(b'stsd', 0, 0, struct.pack('>I', 1), entry)
+        stts, stsz, stsc, stco = self._sample_tables(self.video_offsets, self.video_sizes, delta, 1000)
+        stss = full_box(b'stss', 0, 0, struct.pack('>I', len(self.keyframes)),
+                        _be_bytes(array('I', self.keyframes)))
+        stbl = box(b'stbl', stsd, stts, stss, stsz, stsc, stco)
+        vmhd = full_box(b'vmhd', 0, 1, bytes(8))
+        mdia = self._mdia(b'vide', 'VideoHandler', fps_scale,
+                          len(self.video_sizes) * 1000, vmhd, stbl)
+        return box(b'trak', self._tkhd(1, duration_ms, False, width, height), mdia)
+
+    def _audio_trak(self, delta, rate, duration_ms):
+        profile, sfi, channels = self.audio_config
+        asc = struct.pack('>H', ((profile + 1) << 11) | (sfi << 7) | (channels << 3))
+        dec_specific = b'\x05' + bytes([len(asc)]) + asc
+        dec_config = struct.pack('>BBBHII', 0x40, 0x15, 0, 0, 0, 0) + dec_specific
+        dec_config = b'\x04' + bytes([len(dec_config)]) + dec_config
+        es = struct.pack('>HB', 1, 0) + dec_config + b'\x06\x01\x02'
+        esds = full_box(b'esds', 0, 0, b'\x03' + bytes([len(es)]) + es)
+        entry = box(b'mp4a', bytes(6), struct.pack('>H', 1), bytes(8),
+                    struct.pack('>HHHHI', channels or 2, 16, 0, 0, (rate & 0xFFFF) << 16), esds)
+        stsd = full_box(b'stsd', 0, 0, struct.pack('>I', 1), entry)
+        stts, stsz, stsc, stco = self._sample_tables(self.audio_offsets, self.audio_sizes, delta, 1024)
+        stbl = box(b'stbl', stsd, stts, stsz, stsc, stco)
+        smhd = full_box(b'smhd', 0, 0, bytes(4))
+        mdia = self._mdia(b'soun', 'SoundHandler', rate, len(self.audio_sizes) * 1024, smhd, stbl)
+        return box(b'trak', self._tkhd(2, duration_ms, True), mdia)
+
+    def _avcc(self):
+        sps = self.params[_AvcCodec.SPS]
+        pps = self.params[_AvcCodec.PPS]
+        return (bytes([1, sps[1], sps[2], sps[3], 0xFF, 0xE1]) + struct.pack('>H', len(sps)) + sps
+                + b'\x01' + struct.pack('>H', len(pps)) + pps)
+
+    def _hvcc(self, general, chroma, bd_luma, bd_chroma):
+        data = (b'\x01' + general + struct.pack('>HBBBBHB', 0xF000, 0xFC, 0xFC | chroma,
+                                               0xF8 | bd_luma, 0xF8 | bd_chroma, 0, 0x0F))
+        arrays = [(t, self.params[t]) for t in (_HevcCodec.VPS, _HevcCodec.SPS, _HevcCodec.PPS)]
+        data += bytes([len(arrays)])
+        for t, nal in arrays:
+            data += bytes([0x80 | t]) + struct.pack('>HH', 1, len(nal)) + nal
+        return data
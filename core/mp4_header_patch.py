@@ -0,0 +1,272 @@
+from pathlib import Path
+import logging
+import os
+import struct
+from core.mdat_recovery import iter_boxes
+from core import io_hints
+
+logger = logging.getLogger('mp4recovery')
+
+class HeaderPatchError(Exception):
+    """文件无法只修补头部（没有moov、分片MP4、数据被截断等），需要完整重封装"""
+
+def _top_level_boxes(f, file_size):
+    """逐个读取顶层box头，不读取box内容，产出 (类型, 起始偏移, 头长度, 总长度)"""
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        head = f.read(16)
+        size, box_type = struct.unpack_from('>I4s', head)
+        header = 8
+        if size == 1:
+            if len(head) < 16:
+                break
+            size = struct.unpack_from('>Q', head, 8)[0]
+            header = 16
+        if size == 0:
+            # 32位或64位长度为0都表示延伸到文件末尾
+            size = file_size - pos
+        if size < header:
+            break
+        yield box_type, pos, header, size
+        pos += size
+
+def has_moov(path):
+    """文件是否有完整的顶层moov（录制中断的文件通常没有）"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        for box_type, pos, header, size in _top_level_boxes(f, file_size):
+            if box_type == b'moov':
+                return pos + size <= file_size
+    return False
+
+def read_moov(path):
+    """读取完整的顶层moov，返回 (文件偏移, 头长度, moov字节, 文件大小)；没有或被截断时抛出HeaderPatchError"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        moov = None
+        for box_type, pos, header, size in _top_level_boxes(f, file_size):
+            if box_type == b'moov':
+                moov = (pos, header, size)
+                break
+        if moov is None:
+            raise HeaderPatchError("未找到moov")
+        base, header, size = moov
+        if base + size > file_size:
+            raise HeaderPatchError("moov被截断")
+        f.seek(base)
+        buf = f.read(size)
+        io_hints.drop(f.fileno(), base, base + size)
+    return base, header, buf, file_size
+
+def track_summary(buf, header):
+    """moov中各轨道的 (处理类型, sample数, chunk数)，处理类型如 vide/soun"""
+    tracks = []
+    for pos, h, size in _children(buf, header, len(buf), b'trak'):
+        t_start, t_end = pos + h, pos + size
+        hdlr = _path(buf, t_start, t_end, b'mdia', b'hdlr')
+        handler = buf[hdlr[0] + 8:hdlr[0] + 12].decode('latin-1') if hdlr else ''
+        samples = chunks = 0
+        stbl = _path(buf, t_start, t_end, b'mdia', b'minf', b'stbl')
+        if stbl is not None:
+            stsz = _child(buf, stbl[0], stbl[1], b'stsz')
+            stz2 = _child(buf, stbl[0], stbl[1], b'stz2')
+            if stsz is not None:
+                samples = struct.unpack_from('>I', buf, stsz[0] + stsz[1] + 8)[0]
+            elif stz2 is not None:
+                samples = struct.unpack_from('>I', buf, stz2[0] + stz2[1] + 8)[0]
+            for box_type in (b'stco', b'co64'):
+                found = _child(buf, stbl[0], stbl[1], box_type)
+                if found is not None:
+                    chunks = struct.unpack_from('>I', buf, found[0] + found[1] + 4)[0]
+        tracks.append((handler, samples, chunks))
+    return tracks
+
+def verify_mp4(path, reference=None):
+    """校验修复输出，不通过时抛出HeaderPatchError
+
+    输出需有完整的moov、chunk偏移不超出文件、时长大于0，且每个轨道都有sample和chunk；
+    有reference（原视频）且其moov可读时，原视频中的视频/音频轨道在输出中也必须存在
+    （ffmpeg默认每种类型只选一路，所以只比较类型不比较轨道数）。
+    """
+    stats = HeaderPatch(path).stats
+    if stats['duration'] <= 0:
+        raise HeaderPatchError("时长为0")
+    _, header, buf, _ = read_moov(path)
+    tracks = track_summary(buf, header)
+    empty = [handler or '?' for handler, samples, chunks in tracks if not samples or not chunks]
+    if empty:
+        raise HeaderPatchError(f"轨道没有sample: {'、'.join(empty)}")
+    if reference is not None:
+        try:
+            _, ref_header, ref_buf, _ = read_moov(reference)
+            expected = {handler for handler, samples, _ in track_summary(ref_buf, ref_header)
+                        if samples and handler in ('vide', 'soun')}
+        except (HeaderPatchError, struct.error, OSError):
+            expected = set()  # 原视频没有可读的moov（如从mdat重建），无从比较
+        missing = expected - {handler for handler, _, _ in tracks}
+        if missing:
+            raise HeaderPatchError(f"输出缺少原视频中的轨道: {'、'.join(sorted(missing))}")
+    stats['samples'] = [samples for _, samples, _ in tracks]
+    return stats
+
+def _child(buf, start, end, box_type):
+    for t, pos, header, size in iter_boxes(buf, start, end):
+        if t == box_type:
+            return pos, header, size
+    return None
+
+def _children(buf, start, end, box_type):
+    return [(pos, header, size) for t, pos, header, size in iter_boxes(buf, start, end) if t == box_type]
+
+def _path(buf, start, end, *types):
+    """按box类型路径逐层查找，返回 (内容起始, 内容结束)，找不到时返回None"""
+    for box_type in types:
+        found = _child(buf, start, end, box_type)
+        if found is None:
+            return None
+        pos, header, size = found
+        start, end = pos + header, pos + size
+    return start, end
+
+class HeaderPatch:
+    """根据sample表重新计算时长，得到需要改写的头部字段
+
+    只改写mvhd/tkhd/mdhd中的duration字段：mdhd取stts中各sample时长之和，
+    tkhd和mvhd换算到影片时间刻度，mvhd取各轨道最大值。
+    字段位置是相对文件开头的绝对偏移，可直接应用到同一文件的克隆副本上。
+    """
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.writes = []  # (文件偏移, struct格式, 新值)
+        self.stats = {}
+        self._plan()
+
+    def _plan(self):
+        base, header, buf, file_size = read_moov(self.path)
+        start, end = header, len(buf)
+        if _child(buf, start, end, b'mvex') is not None:
+            raise HeaderPatchError("分片MP4的时长由moof决定，不能只修补头部")
+        mvhd = _child(buf, start, end, b'mvhd')
+        if mvhd is None:
+            raise HeaderPatchError("未找到mvhd")
+        movie_scale, mvhd_duration = self._timescale_field(buf, mvhd[0] + mvhd[1], 12, 20)
+        if not movie_scale:
+            raise HeaderPatchError("mvhd时间刻度为0")
+
+        movie_duration = 0
+        tracks = 0
+        for pos, header, size in _children(buf, start, end, b'trak'):
+            t_start, t_end = pos + header, pos + size
+            self._check_chunk_offsets(buf, t_start, t_end, file_size)
+            mdia = _path(buf, t_start, t_end, b'mdia')
+            stts = _path(buf, t_start, t_end, b'mdia', b'minf', b'stbl', b'stts')
+            tkhd = _child(buf, t_start, t_end, b'tkhd')
+            if mdia is None or stts is None or tkhd is None:
+                continue
+            mdhd = _child(buf, mdia[0], mdia[1], b'mdhd')
+            if mdhd is None:
+                continue
+            media_scale, mdhd_field = self._timescale_field(buf, mdhd[0] + mdhd[1], 12, 20)
+            if not media_scale:
+                continue
+            media_duration = self._stts_duration(buf, *stts)
+            self._set(base, buf, mdhd_field, media_duration)
+            track_duration = self._edited_duration(base, buf, t_start, t_end, media_duration,
+                                                   media_scale, movie_scale)
+            self._set(base, buf, self._tkhd_field(buf, tkhd[0] + tkhd[1]), track_duration)
+            movie_duration = max(movie_duration, track_duration)
+            tracks += 1
+        if not tracks:
+            raise HeaderPatchError("没有可修补的轨道")
+        self._set(base, buf, mvhd_duration, movie_duration)
+        self.stats = {'tracks': tracks, 'patched_fields': len(self.writes),
+                      'duration': round(movie_duration / movie_scale, 3)}
+
+    def _edited_duration(self, base, buf, t_start, t_end, media_duration, media_scale, movie_scale):
+        """按编辑列表（elst）计算轨道时长（影片时间刻度），并改写最后一个编辑的时长
+
+        支持录制软件常见的形式：若干空编辑（media_time为-1，如开头的延迟）加最后一个
+        从media_time播放到结尾的编辑；其他形式（多段剪辑等）无法只修补头部。
+        """
+        elst = _path(buf, t_start, t_end, b'edts', b'elst')
+        if elst is None:
+            return media_duration * movie_scale // media_scale
+        start, end = elst
+        version = buf[start]
+        count = struct.unpack_from('>I', buf, start + 4)[0]
+        fmt, width = ('>Qq', 20) if version == 1 else ('>Ii', 12)
+        if count == 0 or start + 8 + count * width > end:
+            raise HeaderPatchError("elst为空或被截断")
+        total = 0
+        for i in range(count - 1):
+            segment_duration, media_time = struct.unpack_from(fmt, buf, start + 8 + i * width)
+            if media_time != -1:
+                raise HeaderPatchError("编辑列表包含多段剪辑，不能只修补头部")
+            total += segment_duration
+        last = start + 8 + (count - 1) * width
+        media_time = struct.unpack_from(fmt, buf, last)[1]
+        if media_time < 0 or media_time > media_duration:
+            raise HeaderPatchError("编辑列表的起点超出媒体时长，不能只修补头部")
+        segment_duration = (media_duration - media_time) * movie_scale // media_scale
+        self._set(base, buf, (last, fmt[:2]), segment_duration)
+        return total + segment_duration
+
+    @staticmethod
+    def _timescale_field(buf, pos, v0_offset, v1_offset):
+        """mvhd/mdhd：返回 (timescale, duration字段)，字段为 (内容内偏移, 格式)"""
+        if buf[pos] == 1:
+            timescale = struct.unpack_from('>I', buf, pos + v1_offset)[0]
+            return timescale, (pos + v1_offset + 4, '>Q')
+        timescale = struct.unpack_from('>I', buf, pos + v0_offset)[0]
+        return timescale, (pos + v0_offset + 4, '>I')
+
+    @staticmethod
+    def _tkhd_field(buf, pos):
+        if buf[pos] == 1:
+            return pos + 28, '>Q'
+        return pos + 20, '>I'
+
+    @staticmethod
+    def _stts_duration(buf, start, end):
+        count = struct.unpack_from('>I', buf, start + 4)[0]
+        if start + 8 + count * 8 > end:
+            raise HeaderPatchError("stts被截断")
+        total = 0
+        for i in range(count):
+            n, delta = struct.unpack_from('>II', buf, start + 8 + i * 8)
+            total += n * delta
+        return total
+
+    @staticmethod
+    def _check_chunk_offsets(buf, start, end, file_size):
+        """chunk偏移超出文件末尾说明数据被截断，只改头部无法修复"""
+        stbl = _path(buf, start, end, b'mdia', b'minf', b'stbl')
+        if stbl is None:
+            return
+        for box_type, fmt, width in ((b'stco', '>I', 4), (b'co64', '>Q', 8)):
+            found = _child(buf, stbl[0], stbl[1], box_type)
+            if found is None:
+                continue
+            pos = found[0] + found[1]
+            count = struct.unpack_from('>I', buf, pos + 4)[0]
+            if pos + 8 + count * width > found[0] + found[2]:
+                raise HeaderPatchError(f"{box_type.decode()}被截断")
+            if count and max(struct.unpack_from(f'>{count}{fmt[1]}', buf, pos + 8)) >= file_size:
+                raise HeaderPatchError("chunk偏移超出文件末尾，数据不完整")
+
+    def _set(self, base, buf, field, value):
+        offset, fmt = field
+        if fmt == '>I' and value > 0xFFFFFFFF:
+            raise HeaderPatchError("时长超出32位字段范围")
+        if struct.unpack_from(fmt, buf, offset)[0] != value:
+            self.writes.append((base + offset, fmt, value))
+
+    def apply(self, target: Path):
+        """把字段改写应用到target（path本身或其克隆副本），只写入变化的字节"""
+        if not self.writes:
+            return
+        with open(target, 'r+b') as f:
+            for offset, fmt, value in self.writes:
+                f.seek(offset)
+                f.write(struct.pack(fmt, value))
@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import queue
+
+logger = logging.getLogger('mp4recovery')
+
+class ParallelWalker:
+    """多线程目录遍历：同时列出多个目录，适合NFS/SMB等单次往返延迟高的文件系统
+
+    每个目录的列举是线程池中的一个任务，列举完成后其子目录立即作为新任务提交，
+    空闲线程从共享队列中领取任何待列举的目录。产出顺序取决于完成顺序，排序后结果确定。
+    """
+    def __init__(self, rules, threads=8):
+        self.rules = rules
+        self.threads = max(1, threads)
+
+    def walk(self, root, recursive=True):
+        """产出命中规则的文件DirEntry；threads为1时退化为单线程遍历"""
+        if self.threads == 1:
+            yield from self.rules.walk(root, recursive)
+            return
+        # 完成的任务由回调放入队列，每次只取一个结果，不必像wait()那样反复扫描全部未完成任务
+        completed = queue.SimpleQueue()
+        with ThreadPoolExecutor(self.threads, thread_name_prefix='mp4recovery-scan') as pool:
+            def submit(path, rel):
+                pool.submit(self.rules.scan_one, path, rel).add_done_callback(completed.put)
+            submit(str(root), '')
+            outstanding = 1  # 已提交、结果尚未取出的目录数（只在本线程中修改）
+            while outstanding:
+                subdirs, files = completed.get().result()
+                outstanding -= 1
+                yield from files
+                if recursive:
+                    for path, rel in subdirs:
+                        submit(path, rel)
+                        outstanding += 1
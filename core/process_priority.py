@@ -0,0 +1,146 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import platform
+import subprocess
+
+logger = logging.getLogger('mp4recovery')
+
+# ioprio_set/ioprio_get 系统调用号
+_IOPRIO_SYSCALLS = {
+    'x86_64': (251, 252),
+    'amd64': (251, 252),
+    'i386': (289, 290),
+    'i686': (289, 290),
+    'aarch64': (30, 31),
+    'arm64': (30, 31),
+    'armv7l': (314, 315),
+}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+IONICE_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+_IONICE_NAMES = {v: k for k, v in IONICE_CLASSES.items()}
+
+class ProcessPriority:
+    """ffmpeg子进程的CPU/IO优先级设置
+
+    Linux上在子进程创建后由父进程应用：nice值、ionice调度类与级别、CPU亲和性、cgroup；
+    Windows上把nice映射为进程优先级类。applied(pid)读回实际生效的值，写入每个任务的指标。
+    """
+    def __init__(self, nice=0, ionice_class='', ionice_level=4, cpu_affinity=(), cgroup=''):
+        self.nice = int(nice or 0)
+        self.ionice_class = ionice_class or ''
+        if self.ionice_class and self.ionice_class not in IONICE_CLASSES:
+            logger.error(f"未知的ionice类型: {self.ionice_class}，已忽略")
+            self.ionice_class = ''
+        self.ionice_level = min(7, max(0, int(ionice_level)))
+        self.cpu_affinity = sorted(set(cpu_affinity or ()))
+        self.cgroup = cgroup or ''
+        self._syscalls = _IOPRIO_SYSCALLS.get(platform.machine().lower())
+        self._libc = None
+        if os.name != 'nt' and self._syscalls:
+            try:
+                self._libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+            except OSError:
+                self._libc = None
+
+    @classmethod
+    def from_config(cls, config_mgr):
+        return cls(config_mgr.get('ffmpeg_nice', 0),
+                   config_mgr.get('ffmpeg_ionice_class', ''),
+                   config_mgr.get('ffmpeg_ionice_level', 4),
+                   config_mgr.get('ffmpeg_cpu_affinity', []),
+                   config_mgr.get('ffmpeg_cgroup', ''))
+
+    def is_default(self):
+        return not (self.nice or self.ionice_class or self.cpu_affinity or self.cgroup)
+
+    def popen_kwargs(self):
+        """传给subprocess.Popen的额外参数（只用于Windows的优先级类，其他系统由apply()在创建后设置）"""
+        if os.name != 'nt' or self.is_default():
+            return {}
+        if self.nice >= 15:
+            return {'creationflags': subprocess.IDLE_PRIORITY_CLASS}
+        if self.nice > 0:
+            return {'creationflags': subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+        return {}
+
+    def apply(self, pid):
+        """子进程创建后立即在父进程中设置，尽力而为：失败不影响ffmpeg运行，实际值由applied()读回
+
+        不使用preexec_fn：本进程总有其他线程（日志、工作线程、扫描线程），fork后在子进程中
+        执行Python代码可能因fork时被持有的锁而死锁，且会使subprocess无法使用vfork/posix_spawn。
+        Linux上nice、ionice、CPU亲和性按线程生效，对子进程已创建的全部线程逐个设置。
+        """
+        if os.name == 'nt' or self.is_default():
+            return
+        if self.cgroup:
+            # 写入cgroup.procs会移动整个进程（包括全部线程）
+            try:
+                with open(os.path.join(self.cgroup, 'cgroup.procs'), 'w') as f:
+                    f.write(str(pid))
+            except OSError:
+                pass
+        nice = None
+        if self.nice:
+            try:
+                # 子进程继承本进程的nice值，ffmpeg_nice是在此基础上的增量（与os.nice一致）
+                nice = min(19, max(-20, os.getpriority(os.PRIO_PROCESS, 0) + self.nice))
+            except OSError:
+                pass
+        ioprio = None
+        if self.ionice_class and self._libc is not None:
+            ioprio = (IONICE_CLASSES[self.ionice_class] << _IOPRIO_CLASS_SHIFT) | (
+                0 if self.ionice_class == 'idle' else self.ionice_level)
+        for tid in self._threads(pid):
+            if nice is not None:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, nice)
+                except OSError:
+                    pass
+            if ioprio is not None:
+                self._libc.syscall(self._syscalls[0], _IOPRIO_WHO_PROCESS, tid, ioprio)
+            if self.cpu_affinity and hasattr(os, 'sched_setaffinity'):
+                try:
+                    os.sched_setaffinity(tid, self.cpu_affinity)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _threads(pid):
+        """进程的全部线程号（没有/proc时只有pid本身）"""
+        try:
+            return [int(tid) for tid in os.listdir(f'/proc/{pid}/task')] or [pid]
+        except OSError:
+            return [pid]
+
+    def applied(self, pid):
+        """读回子进程实际生效的优先级"""
+        info = {}
+        if os.name == 'nt':
+            if self.nice > 0:
+                info['priority_class'] = 'idle' if self.nice >= 15 else 'below_normal'
+            return info
+        try:
+            info['nice'] = os.getpriority(os.PRIO_PROCESS, pid)
+        except OSError:
+            pass
+        if self._libc is not None:
+            value = self._libc.syscall(self._syscalls[1], _IOPRIO_WHO_PROCESS, pid)
+            if value >= 0:
+                cls = value >> _IOPRIO_CLASS_SHIFT
+                info['ionice'] = (f"{_IONICE_NAMES.get(cls, 'none')}"
+                                  + ('' if cls in (0, 3) else f":{value & 0xFF}"))
+        if hasattr(os, 'sched_getaffinity'):
+            try:
+                info['cpu_affinity'] = sorted(os.sched_getaffinity(pid))
+            except OSError:
+                pass
+        if self.cgroup:
+            try:
+                with open(f'/proc/{pid}/cgroup', encoding='utf-8') as f:
+                    info['cgroup'] = f.read().strip()
+            except OSError:
+                pass
+        return info
@@ -0,0 +1,48 @@
+from pathlib import Path
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import sys
+
+logger = logging.getLogger('mp4recovery')
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int)，btrfs/XFS/bcachefs等支持
+# 文件系统不支持共享数据块时返回的错误码，此时调用方退回普通复制
+_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTSUP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.ENOSYS}
+
+def reflink(src: Path, dst: Path):
+    """以写时复制方式克隆文件（与原文件共享数据块），成功返回True
+
+    Linux上使用ioctl FICLONE，macOS（APFS）上使用clonefile；
+    其他系统或文件系统不支持时返回False且不留下dst，其余错误直接抛出。
+    """
+    if sys.platform.startswith('linux'):
+        return _ficlone(src, dst)
+    if sys.platform == 'darwin':
+        return _clonefile(src, dst)
+    return False
+
+def _ficlone(src, dst):
+    import fcntl
+    with open(src, 'rb') as fin, open(dst, 'xb') as fout:
+        try:
+            fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+            return True
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+    os.unlink(dst)
+    return False
+
+def _clonefile(src, dst):
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if not hasattr(libc, 'clonefile'):
+        return False
+    if libc.clonefile(os.fsencode(str(src)), os.fsencode(str(dst)), 0) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in _UNSUPPORTED:
+        return False
+    raise OSError(err, os.strerror(err), str(dst))
@@ -0,0 +1,148 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+import logging
+import shutil
+from core.ffmpeg_runner import run_ffmpeg
+from core.io_hints import StreamHints
+
+logger = logging.getLogger('mp4recovery')
+file_logger = logging.getLogger('mp4recovery.fileonly')
+
+class RemuxError(Exception):
+    """重封装失败，stderr为后端输出的错误信息"""
+    def __init__(self, message, stderr=''):
+        super().__init__(message)
+        self.stderr = stderr or message
+
+class RemuxEngine(ABC):
+    """重封装后端接口：把input_file按流复制（-c copy）写成output_file
+
+    remux()成功时返回该任务的指标字典，失败时抛出RemuxError；
+    control（JobControl）用于暂停/取消/限速，priority（ProcessPriority）只对子进程后端有效。
+    """
+    name = ''
+
+    def available(self):
+        return True
+
+    @abstractmethod
+    def remux(self, input_file: Path, output_file: Path, control=None, priority=None):
+        """按流复制重封装，返回指标字典，失败时抛出RemuxError"""
+
+class FFmpegSubprocessEngine(RemuxEngine):
+    """每个文件启动一个ffmpeg子进程"""
+    name = 'ffmpeg'
+
+    def __init__(self, ffmpeg_mgr):
+        self.ffmpeg_mgr = ffmpeg_mgr
+
+    def available(self):
+        return self.ffmpeg_mgr.get_ffmpeg_path() is not None
+
+    def remux(self, input_file, output_file, control=None, priority=None, input_args=()):
+        """input_args为放在-i之前的输入选项（如容错重封装的-fflags/-err_detect）"""
+        cmd = [self.ffmpeg_mgr.get_ffmpeg_path(), *input_args, '-i', str(input_file),
+               '-map_metadata', '0', '-c', 'copy', str(output_file)]
+        result = run_ffmpeg(cmd, control, output_file, priority, input_file)
+        if result.returncode != 0:
+            raise RemuxError(f"FFmpeg退出码 {result.returncode}", result.stderr)
+        return {'priority': result.priority}
+
+    def concat(self, list_file, output_file, control=None, priority=None, input_args=()):
+        """按concat列表（ffconcat）把多个文件一次流复制拼接为一个"""
+        cmd = [self.ffmpeg_mgr.get_ffmpeg_path(), *input_args, '-f', 'concat', '-safe', '0',
+               '-i', str(list_file), '-map_metadata', '0', '-c', 'copy', str(output_file)]
+        result = run_ffmpeg(cmd, control, output_file, priority)
+        if result.returncode != 0:
+            raise RemuxError(f"FFmpeg退出码 {result.returncode}", result.stderr)
+        return {'priority': result.priority}
+
+class PyAVEngine(RemuxEngine):
+    """进程内的libav后端（需要安装PyAV），省去每个文件的进程创建和stderr文本解码"""
+    name = 'pyav'
+
+    def __init__(self):
+        try:
+            import av
+            self._av = av
+        except ImportError:
+            self._av = None
+
+    def available(self):
+        return self._av is not None
+
+    def remux(self, input_file, output_file, control=None, priority=None):
+        av = self._av
+        if av is None:
+            raise RemuxError("未安装PyAV")
+        packets = 0
+        hints = StreamHints(input_file)
+        try:
+            with av.open(str(input_file)) as src, av.open(str(output_file), 'w', format='mp4') as dst:
+                dst.metadata.update(src.metadata)  # 对应 -map_metadata 0
+                # 与ffmpeg默认的流选择一致：各取一路视频和音频
+                selected = list(src.streams.video[:1]) + list(src.streams.audio[:1])
+                if not selected:
+                    raise RemuxError("没有可复制的音视频流")
+                mapping = {s.index: self._add_stream(dst, s) for s in selected}
+                for packet in src.demux(*selected):
+                    if packet.dts is None:  # demux结束时的空包
+                        continue
+                    size = packet.size
+                    packet.stream = mapping[packet.stream.index]
+                    pos = packet.pos
+                    dst.mux(packet)
+                    packets += 1
+                    if pos is not None and pos >= 0:
+                        hints.advance(pos)
+                    if control is not None:
+                        control.checkpoint(size)
+        except av.error.FFmpegError as e:
+            raise RemuxError(str(e), str(e))
+        finally:
+            hints.close()
+        return {'packets': packets}
+
+    @staticmethod
+    def _add_stream(dst, template):
+        # PyAV 13起使用add_stream_from_template
+        if hasattr(dst, 'add_stream_from_template'):
+            return dst.add_stream_from_template(template)
+        return dst.add_stream(template=template)
+
+class NullEngine(RemuxEngine):
+    """不做重封装，直接复制原文件，用于测试处理流程"""
+    name = 'null'
+
+    def remux(self, input_file, output_file, control=None, priority=None):
+        shutil.copyfile(input_file, output_file)
+        return {}
+
+class EngineSelector:
+    """按配置选择后端：remux_engine 为 ffmpeg / pyav / null / auto
+
+    auto 时不超过 pyav_max_mb 的文件在PyAV可用时走进程内后端，其余用ffmpeg子进程。
+    """
+    def __init__(self, ffmpeg_mgr, config_mgr):
+        self.config_mgr = config_mgr
+        self.engines = {e.name: e for e in (FFmpegSubprocessEngine(ffmpeg_mgr), PyAVEngine(), NullEngine())}
+        self.override = None  # 本次运行指定的后端（命令行 --engine）
+        if not self.engines['pyav'].available():
+            file_logger.info("未安装PyAV，进程内重封装后端不可用")
+
+    def select(self, input_file: Path):
+        name = self.override or self.config_mgr.get('remux_engine', 'auto')
+        if name == 'auto':
+            max_size = self.config_mgr.get('pyav_max_mb', 256) * 1024 * 1024
+            pyav = self.engines['pyav']
+            if pyav.available() and Path(input_file).stat().st_size <= max_size:
+                return pyav
+            return self.engines['ffmpeg']
+        engine = self.engines.get(name)
+        if engine is None:
+            logger.error(f"未知的重封装后端: {name}，改用ffmpeg")
+            return self.engines['ffmpeg']
+        if not engine.available():
+            logger.error(f"重封装后端 {name} 不可用，改用ffmpeg")
+            return self.engines['ffmpeg']
+        return engine
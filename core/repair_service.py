@@ -0,0 +1,286 @@
+from pathlib import Path
+from collections import deque
+import json
+import logging
+import threading
+import time
+from core.http_api import JsonServer
+from core.job_queue import path_key
+from core.concurrency import ConcurrencyController
+from core.tmp_dir_manager import TmpDirManager
+from core.job_control import JobCancelled
+
+logger = logging.getLogger('mp4recovery')
+file_logger = logging.getLogger('mp4recovery.fileonly')
+
+class RepairService:
+    """常驻修复服务：FFmpeg/配置/工作线程保持就绪，其他进程通过JSON接口批量提交任务
+
+    接口（localhost HTTP 或 Unix套接字）：
+        POST /submit   {files: [...]}             -> 202 {ids, duplicates}；队列满时 429 {error, retry_after}
+        GET  /status   [?id=N]                    -> 各状态计数和队列容量；带id时返回该任务
+        POST /cancel   {ids: [...]} 或 {all: true} -> {cancelled, running}（正在处理的任务不能单独取消）
+        GET  /results  [?since=SEQ]               -> 按完成顺序持续输出结果（每行一个JSON）
+    一批提交要么全部入队，要么（超出队列容量时）全部拒绝，调用方按retry_after重试。
+    每个文件单独处理：服务模式不识别分段系列（concat_segments只对扫描目录得到的批次生效）。
+    """
+    def __init__(self, processor, capacity=10000, history=10000):
+        self.processor = processor
+        self.capacity = max(1, capacity)
+        self.concurrency = ConcurrencyController(processor.config_mgr)
+        self.jobs = {}              # 任务编号 -> 任务信息
+        self.pending = deque()      # 待处理的任务编号
+        self.active = {}            # 规范化路径 -> 排队中/处理中的任务编号（用于去重）
+        self.results = deque(maxlen=max(1, history))  # (序号, 结果) 最近完成的任务
+        self._next_id = 1
+        self._seq = 0
+        self._running = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self.server = None
+
+    # -----------------------------------------------------------------------
+    # 任务管理
+    # -----------------------------------------------------------------------
+
+    def submit(self, files):
+        """提交一批文件，返回 (新任务编号列表, 重复的 {路径: 已有编号})；超出容量时返回None"""
+        with self._cond:
+            ids, duplicates, fresh = [], {}, {}
+            for f in files:
+                key = path_key(f)
+                if key in self.active:
+                    duplicates[str(f)] = self.active[key]
+                else:
+                    fresh.setdefault(key, str(f))
+            if len(self.pending) + len(fresh) > self.capacity:
+                return None
+            for key, path in fresh.items():
+                job_id = self._next_id
+                self._next_id += 1
+                self.jobs[job_id] = {'id': job_id, 'path': path, 'state': 'queued',
+                                     'submitted': time.time(), 'result': None}
+                self.active[key] = job_id
+                self.pending.append(job_id)
+                ids.append(job_id)
+            self._cond.notify_all()
+        if ids:
+            file_logger.info(f"服务收到 {len(ids)} 个任务")
+        return ids, duplicates
+
+    def cancel(self, ids=None):
+        """取消排队中的任务（ids为None时取消全部排队任务），返回 (已取消, 处理中无法取消)"""
+        cancelled, running = [], []
+        with self._cond:
+            targets = list(self.pending) if ids is None else ids
+            for job_id in targets:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                if job['state'] == 'queued':
+                    self.pending.remove(job_id)
+                    self._finish_locked(job, 'cancelled', None)
+                    cancelled.append(job_id)
+                elif job['state'] == 'running':
+                    running.append(job_id)
+        return cancelled, running
+
+    def status(self, job_id=None):
+        with self._cond:
+            if job_id is not None:
+                return self.jobs.get(job_id)
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['state']] = counts.get(job['state'], 0) + 1
+            return {'counts': counts, 'queued': len(self.pending), 'running': self._running,
+                    'capacity': self.capacity, 'last_seq': self._seq,
+                    'paused': self.processor.control.is_paused()}
+
+    def wait_results(self, since, timeout):
+        """返回序号大于since的结果；没有时最多等待timeout秒"""
+        with self._cond:
+            if self._seq <= since:
+                self._cond.wait(timeout)
+            return [(seq, r) for seq, r in self.results if seq > since]
+
+    def _finish_locked(self, job, state, result):
+        job['state'] = state
+        job['result'] = result
+        self.active.pop(path_key(job['path']), None)
+        self._seq += 1
+        if len(self.results) == self.results.maxlen:
+            # 最早的结果移出历史，任务信息一并删除
+            _, old = self.results[0]
+            self.jobs.pop(old['id'], None)
+        self.results.append((self._seq, {'id': job['id'], 'path': job['path'],
+                                         'state': state, 'result': result}))
+        self._cond.notify_all()
+
+    # -----------------------------------------------------------------------
+    # 工作线程
+    # -----------------------------------------------------------------------
+
+    def start_workers(self):
+        self.processor.tmp_manager = TmpDirManager()
+        self._threads = [threading.Thread(target=self._work_loop, name=f"mp4recovery-service-{i}", daemon=True)
+                         for i in range(self.concurrency.max_workers)]
+        for t in self._threads:
+            t.start()
+
+    def _work_loop(self):
+        control = self.processor.control
+        while not self._stop.is_set():
+            try:
+                control.wait_if_paused()
+            except JobCancelled:
+                return
+            with self._cond:
+                if not self.pending:
+                    self._cond.wait(0.5)
+                    continue
+                job = self.jobs[self.pending.popleft()]
+                job['state'] = 'running'
+                self._running += 1
+            path = Path(job['path'])
+            limiter = self.concurrency.limiter_for(path.parent)
+            ticket = limiter.acquire(control)
+            result = None
+            error = None
+            size = 0
+            try:
+                if ticket is not None:
+                    try:
+                        size = path.stat().st_size
+                    except OSError:
+                        pass
+                    result = self.processor.process_video(path)
+            except Exception as e:
+                # 单个任务的意外错误不结束工作线程，该任务记为失败
+                error = f"处理失败（原视频保留）: {path}，错误: {str(e)}"
+                logger.error(error)
+            finally:
+                cancelled = error is None and (result is None or result.metrics.get('cancelled'))
+                if ticket is not None:
+                    # 只有成功的任务计入吞吐量
+                    measured = result is not None and result.success and not cancelled
+                    limiter.release(ticket, size if measured else 0, result.elapsed if result is not None else 0.0)
+                if error is not None:
+                    outcome = {'path': str(path), 'success': False, 'message': error}
+                else:
+                    outcome = result.to_dict() if result is not None else None
+                with self._cond:
+                    self._running -= 1
+                    if cancelled:
+                        state = 'cancelled'
+                    else:
+                        state = 'done' if result else 'failed'
+                    self._finish_locked(job, state, outcome)
+                    idle = not self.pending and self._running == 0
+            if idle:
+                # 队列处理完时统一落盘，避免原视频长期暂存
+                self.processor.flush_commits()
+
+    # -----------------------------------------------------------------------
+    # HTTP接口
+    # -----------------------------------------------------------------------
+
+    def routes(self):
+        def submit(body, _):
+            files = body.get('files')
+            if not isinstance(files, list) or not all(isinstance(f, str) for f in files):
+                return 400, {'error': 'files必须是路径字符串列表'}
+            missing = [f for f in files if not Path(f).is_file()]
+            if missing:
+                return 400, {'error': '文件不存在或不是普通文件', 'files': missing}
+            accepted = self.submit(files)
+            if accepted is None:
+                return 429, {'error': '队列已满', 'queued': len(self.pending),
+                             'capacity': self.capacity, 'retry_after': 5}
+            ids, duplicates = accepted
+            return 202, {'ids': ids, 'duplicates': duplicates}
+
+        def status(body, handler):
+            job_id = handler.query().get('id')
+            if job_id is None:
+                return 200, self.status()
+            if not job_id.isdigit():
+                return 400, {'error': f'任务编号必须是整数: {job_id}'}
+            job = self.status(int(job_id))
+            return (200, job) if job else (404, {'error': f'未知任务: {job_id}'})
+
+        def cancel(body, _):
+            ids = None if body.get('all') else body.get('ids', [])
+            if ids is not None and (not isinstance(ids, list)
+                                    or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+                return 400, {'error': 'ids必须是任务编号（整数）列表'}
+            cancelled, running = self.cancel(ids)
+            return 200, {'cancelled': cancelled, 'running': running}
+
+        def results(body, handler):
+            since = handler.query().get('since', '0')
+            if not since.isdigit():
+                return 400, {'error': f'since必须是整数: {since}'}
+            self._stream_results(handler, int(since))
+
+        return {
+            ('POST', '/submit'): submit,
+            ('GET', '/status'): status,
+            ('POST', '/cancel'): cancel,
+            ('GET', '/results'): results,
+        }
+
+    def _stream_results(self, handler, since):
+        """以分块传输持续写出结果，直到客户端断开或服务停止"""
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        handler.send_header('Transfer-Encoding', 'chunked')
+        handler.end_headers()
+        try:
+            while not self._stop.is_set():
+                batch = self.wait_results(since, 15)
+                # 没有新结果时发送空行作为心跳，及时发现已断开的客户端
+                lines = [json.dumps(dict(r, seq=seq), ensure_ascii=False) for seq, r in batch] or ['']
+                data = ('\n'.join(lines) + '\n').encode('utf-8')
+                handler.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                handler.wfile.flush()
+                if batch:
+                    since = batch[-1][0]
+            handler.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            pass  # 客户端断开
+        handler.close_connection = True
+
+    def serve(self, host='127.0.0.1', port=8765, unix_path=None):
+        self.start_workers()
+        self.server = JsonServer(self.routes(), host, port, unix_path).start()
+        if self.processor.config_mgr.get('concat_segments', False):
+            logger.info("服务模式逐个处理提交的文件，不拼接分段系列")
+        logger.info(f"修复服务已启动: {self.server.address}，队列容量 {self.capacity}，"
+                    f"最多 {self.concurrency.max_workers} 个并发")
+        return self.server.address
+
+    def request_stop(self):
+        """请求停止（可在信号处理函数中调用），wait()随即返回"""
+        self._stop.set()
+
+    def wait(self):
+        """阻塞直到request_stop()或stop()"""
+        while not self._stop.wait(1.0):
+            pass
+
+    def stop(self):
+        """停止服务：不再接收请求，取消处理中的任务，落盘并清理临时目录"""
+        self._stop.set()
+        if self.server:
+            self.server.stop()
+            self.server = None
+        self.processor.control.cancel()
+        for t in self._threads:
+            t.join()
+        self.processor.flush_commits()
+        if self.processor.tmp_manager is not None:
+            self.processor.tmp_manager.cleanup_tmp_dirs()
+            self.processor.tmp_manager = None
+        self.concurrency.log_summary()
+        logger.info("修复服务已停止")
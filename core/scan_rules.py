@@ -0,0 +1,150 @@
+import fnmatch
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger('mp4recovery')
+
+class ScanRule:
+    """单条包含/排除规则
+
+    目录规则（含 dir_glob / dir_regex）匹配目录名或相对扫描根目录的路径（用/分隔），
+    被排除的目录不会进入；文件规则按文件名、大小（MB）、修改时间（天）判断，
+    同一条规则里的多个条件需同时满足。
+    """
+    DIR_KEYS = ('dir_glob', 'dir_regex')
+    FILE_KEYS = ('name_glob', 'name_regex', 'min_size_mb', 'max_size_mb',
+                 'newer_than_days', 'older_than_days')
+
+    def __init__(self, spec):
+        self.action = spec.get('action', 'exclude')
+        if self.action not in ('include', 'exclude'):
+            raise ValueError(f"未知的规则动作: {self.action}")
+        self.include = self.action == 'include'
+        self.is_dir_rule = any(k in spec for k in self.DIR_KEYS)
+        if not self.is_dir_rule and not any(k in spec for k in self.FILE_KEYS):
+            raise ValueError(f"规则缺少匹配条件: {spec}")
+        self.glob = spec.get('dir_glob') if self.is_dir_rule else spec.get('name_glob')
+        pattern = spec.get('dir_regex') if self.is_dir_rule else spec.get('name_regex')
+        self.regex = re.compile(pattern) if pattern else None
+        now = time.time()
+        self.min_size = self._mb(spec.get('min_size_mb'))
+        self.max_size = self._mb(spec.get('max_size_mb'))
+        self.newer_than = self._days_ago(now, spec.get('newer_than_days'))
+        self.older_than = self._days_ago(now, spec.get('older_than_days'))
+        self.needs_stat = any(v is not None for v in
+                              (self.min_size, self.max_size, self.newer_than, self.older_than))
+
+    @staticmethod
+    def _mb(value):
+        return None if value is None else float(value) * 1024 * 1024
+
+    @staticmethod
+    def _days_ago(now, value):
+        return None if value is None else now - float(value) * 86400
+
+    def _match_text(self, name, rel):
+        if self.glob and not (fnmatch.fnmatch(name, self.glob) or fnmatch.fnmatch(rel, self.glob)):
+            return False
+        if self.regex and not (self.regex.search(name) or self.regex.search(rel)):
+            return False
+        return True
+
+    def match_dir(self, name, rel):
+        return self._match_text(name, rel)
+
+    def match_file(self, entry, rel):
+        if not self._match_text(entry.name, rel):
+            return False
+        if self.needs_stat:
+            st = entry.stat()
+            if self.min_size is not None and st.st_size < self.min_size:
+                return False
+            if self.max_size is not None and st.st_size > self.max_size:
+                return False
+            if self.newer_than is not None and st.st_mtime < self.newer_than:
+                return False
+            if self.older_than is not None and st.st_mtime > self.older_than:
+                return False
+        return True
+
+class ScanRuleSet:
+    """有序的包含/排除规则集：编译一次，在遍历目录时即时判断，第一条命中的规则生效"""
+    VIDEO_EXT = '.mp4'
+
+    def __init__(self, rules=(), skip_pattern=None, on_skip=None):
+        self.dir_rules = []
+        self.file_rules = []
+        for spec in rules:
+            try:
+                rule = ScanRule(spec)
+            except (ValueError, re.error) as e:
+                logger.error(f"忽略无效的扫描规则 {spec}: {str(e)}")
+                continue
+            (self.dir_rules if rule.is_dir_rule else self.file_rules).append(rule)
+        self.needs_stat = any(rule.needs_stat for rule in self.file_rules)  # 判断文件时会stat
+        self.skip_regex = None
+        if skip_pattern:
+            try:
+                self.skip_regex = re.compile(skip_pattern)
+            except re.error as e:
+                logger.error(f"正则表达式无效: {str(e)}")
+        self.on_skip = on_skip  # 被skip_pattern跳过的文件回调
+
+    @classmethod
+    def from_config(cls, config_mgr, on_skip=None):
+        return cls(config_mgr.get('scan_rules', []),
+                   config_mgr.get('skip_pattern', '^.*meta$'), on_skip)
+
+    def accept_dir(self, name, rel):
+        for rule in self.dir_rules:
+            if rule.match_dir(name, rel):
+                return rule.include
+        return True
+
+    def accept_file(self, entry, rel):
+        if not entry.name.lower().endswith(self.VIDEO_EXT):
+            return False
+        if self.skip_regex and self.skip_regex.search(os.path.splitext(entry.name)[0]):
+            if self.on_skip:
+                self.on_skip(entry.path)
+            return False
+        for rule in self.file_rules:
+            if rule.match_file(entry, rel):
+                return rule.include
+        return True
+
+    def scan_one(self, dir_path, rel_dir=''):
+        """列出单个目录：返回 (待进入的子目录[(路径, 相对路径)], 命中的文件DirEntry列表)"""
+        subdirs = []
+        files = []
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            logger.error(f"无法读取目录 {dir_path}: {str(e)}")
+            return subdirs, files
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if self.accept_dir(entry.name, rel):
+                        subdirs.append((entry.path, rel))
+                    else:
+                        logger.info(f"按规则跳过目录: {entry.path}")
+                elif entry.is_file() and self.accept_file(entry, rel):
+                    files.append(entry)
+            except OSError as e:
+                logger.error(f"读取 {entry.path} 失败: {str(e)}")
+        return subdirs, files
+
+    def walk(self, root, recursive=True):
+        """深度优先遍历，排除的目录不会进入，按遍历顺序产出文件DirEntry"""
+        stack = [(str(root), '')]
+        while stack:
+            dir_path, rel_dir = stack.pop()
+            subdirs, files = self.scan_one(dir_path, rel_dir)
+            yield from files
+            if recursive:
+                stack.extend(reversed(subdirs))
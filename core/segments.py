@@ -0,0 +1,87 @@
+from pathlib import Path
+import logging
+import re
+
+logger = logging.getLogger('mp4recovery')
+
+def compile_pattern(pattern):
+    """编译分段文件名规则（第1组为系列名、第2组为段号），规则无效时返回None"""
+    try:
+        compiled = re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        logger.error(f"分段文件名规则无效: {pattern}，错误: {str(e)}")
+        return None
+    if compiled.groups < 2:
+        logger.error(f"分段文件名规则需要两个分组（系列名、段号）: {pattern}")
+        return None
+    return compiled
+
+def write_concat_list(path: Path, inputs, durations):
+    """写出ffmpeg concat分离器的列表文件
+
+    已知时长的段写出duration，拼接时按它计算下一段的起始时间，
+    不依赖原文件头部（录制中断时头部记录的时长通常不对）。
+    """
+    lines = ['ffconcat version 1.0']
+    for file, duration in zip(inputs, durations):
+        escaped = str(file).replace("'", "'\\''")
+        lines.append(f"file '{escaped}'")
+        if duration:
+            lines.append(f"duration {duration:.6f}")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+# ASS事件行：Dialogue/Comment: Layer,Start,End,...
+_ASS_EVENT = re.compile(r'^((?:Dialogue|Comment):\s*[^,]*,)(\d+):(\d{2}):(\d{2})\.(\d{2}),(\d+):(\d{2}):(\d{2})\.(\d{2}),',
+                        re.MULTILINE)
+# 弹幕XML：<d p="出现时间,...">
+_XML_DANMAKU = re.compile(r'(<d\s+p=")([0-9.]+)')
+
+def _ass_time(h, m, s, cs, offset):
+    total = round((int(h) * 3600 + int(m) * 60 + int(s)) * 100 + int(cs) + offset * 100)
+    h, rest = divmod(total, 360000)
+    m, rest = divmod(rest, 6000)
+    s, cs = divmod(rest, 100)
+    return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+def shift_ass(text, offset):
+    """ASS各事件的开始/结束时间后移offset秒"""
+    if not offset:
+        return text
+    return _ASS_EVENT.sub(lambda m: (m.group(1) + _ass_time(*m.group(2, 3, 4, 5), offset) + ','
+                                     + _ass_time(*m.group(6, 7, 8, 9), offset) + ','), text)
+
+def shift_xml(text, offset):
+    """弹幕XML各条弹幕的出现时间后移offset秒"""
+    if not offset:
+        return text
+    return _XML_DANMAKU.sub(lambda m: f"{m.group(1)}{float(m.group(2)) + offset:.5f}", text)
+
+def merge_sidecars(ext, sources, target: Path):
+    """把各段的关联文件按段的起始时间平移后合并为一个
+
+    sources为 [(文件, 该段在拼接后视频中的起始秒数)]；保留第一个文件的头部（样式、元数据），
+    ASS追加后续文件的事件行，XML把后续文件的弹幕插入到第一个文件的最后一条弹幕之后。
+    """
+    texts = []
+    for file, offset in sources:
+        with open(file, encoding='utf-8-sig') as f:
+            text = f.read()
+        texts.append(shift_ass(text, offset) if ext == '.ass' else shift_xml(text, offset))
+    merged = texts[0]
+    if ext == '.ass':
+        events = [m.group(0) for text in texts[1:]
+                  for m in re.finditer(r'^(?:Dialogue|Comment):.*$', text, re.MULTILINE)]
+        if events:
+            merged = merged.rstrip('\n') + '\n' + '\n'.join(events) + '\n'
+    else:
+        danmaku = [m.group(0) for text in texts[1:]
+                   for m in re.finditer(r'<d\s+p="[^"]*"[^>]*>.*?</d>', text, re.DOTALL)]
+        if danmaku:
+            last = merged.rfind('</d>')
+            insert = last + len('</d>') if last >= 0 else merged.rfind('</')
+            if insert < 0:
+                insert = len(merged)
+            merged = merged[:insert] + '\n' + '\n'.join(danmaku) + merged[insert:]
+    with open(target, 'w', encoding='utf-8') as f:
+        f.write(merged)
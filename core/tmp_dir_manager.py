@@ -1,10 +1,12 @@
 from pathlib import Path
 import random
+import threading
 
 class TmpDirManager:
     def __init__(self):
         self.created_tmp_dirs = []  # 记录创建的tmp文件夹
         self.dir_tmp_map = {}       # 目录到tmp的映射
+        self._lock = threading.Lock()
 
     def create_tmp_dirs(self, orig_dirs):
         """
@@ -20,6 +22,16 @@ class TmpDirManager:
         self.dir_tmp_map = tmp_dir_map
         return tmp_dir_map
 
+    def get_tmp_dir(self, orig_dir):
+        """按需为单个目录创建临时目录，已创建则直接复用"""
+        orig_dir = Path(orig_dir)
+        with self._lock:
+            tmp_dir = self.dir_tmp_map.get(orig_dir)
+            if tmp_dir is None:
+                tmp_dir = self._get_unique_tmp_dir(orig_dir)
+                self.dir_tmp_map[orig_dir] = tmp_dir
+            return tmp_dir
+
     def _get_unique_tmp_dir(self, base_dir):
         base_dir = Path(base_dir)
         tried = set()
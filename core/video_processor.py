@@ -1,102 +1,287 @@
 from PyQt5.QtCore import QObject, pyqtSignal, QThread
 from pathlib import Path
-import subprocess
 import logging
-import re
 import tempfile
-import shutil
 import time
 import random
+import threading
+import os
+import struct
+from core.scan_rules import ScanRuleSet
+from core.parallel_walker import ParallelWalker
+from core.commit import CommitUnit, CommitBatcher
+from core.mdat_recovery import MdatRecovery, RecoveryError
+from core.job_control import JobControl, JobCancelled
+from core.remux_engine import EngineSelector, RemuxError
+from core.mp4_header_patch import HeaderPatch, HeaderPatchError, has_moov, read_moov, verify_mp4
+from core.reflink import reflink
+from core import io_hints
+from core.process_priority import ProcessPriority
+from core.job_queue import JobQueue, JobTable, normalize_roots, path_key
+from core.concurrency import ConcurrencyController
+from core.segments import compile_pattern, write_concat_list, merge_sidecars
 
 logger = logging.getLogger('mp4recovery')  # UI和文件都输出
 file_logger = logging.getLogger('mp4recovery.fileonly')  # 只输出到文件
 
+class JobResult:
+    """单个视频的处理结果，布尔值等同于是否处理成功"""
+    __slots__ = ('path', 'success', 'message', 'output', 'elapsed', 'metrics')
+
+    def __init__(self, path, success, message='', output=None, elapsed=0.0, metrics=None):
+        self.path = str(path)
+        self.success = success
+        self.message = message
+        self.output = str(output) if output else None
+        self.elapsed = elapsed
+        self.metrics = metrics or {}
+
+    def __bool__(self):
+        return self.success
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class RepairFailed(Exception):
+    """修复方式的输出未通过校验"""
+
 class ProcessWorker(QThread):
     progress = pyqtSignal(str, bool)
     finished = pyqtSignal()
     
-    def __init__(self, processor, files):
+    def __init__(self, processor, files, concurrency):
         super().__init__()
         self.processor = processor
-        self.files = files
+        self.queue = JobQueue(files)  # 所有根目录共用的任务队列
+        self.concurrency = concurrency  # 按卷自适应的并发限制
+        self.max_workers = concurrency.max_workers
+        self.remaining = []  # 取消时尚未处理的文件（路径字符串）
+        self._lock = threading.Lock()
+
+    def add_files(self, files):
+        """处理过程中追加文件（按规范化路径去重），返回新加入的数量；批次已结束时返回None"""
+        return self.queue.put_many(files)
+
+    def add_directory(self, directory, recursive=True):
+        """在后台线程扫描目录并追加到队列（不阻塞界面），扫描期间批次不会结束；批次已结束时返回False"""
+        if not self.queue.begin_append():
+            return False
+        def scan():
+            try:
+                files = self.processor.scan_directory(directory, recursive, save_list=False)
+                added = self.queue.put_many(files)
+                logger.info(f"已追加 {added} 个视频到正在运行的批次: {directory}")
+            except Exception as e:
+                logger.error(f"追加目录失败: {directory}，错误: {str(e)}")
+            finally:
+                self.queue.end_append()
+        threading.Thread(target=scan, name="mp4recovery-append-scan", daemon=True).start()
+        return True
         
     def run(self):
-        for file in self.files:
-            result = self.processor.process_video(file)
-            # 处理结果已经通过processor的信号发出
+        threads = [threading.Thread(target=self._work_loop, name=f"mp4recovery-worker-{i}")
+                   for i in range(self.max_workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.concurrency.log_summary()
+        # 批量落盘并删除暂存的原视频（需在清理临时目录之前）
+        self.processor.flush_commits()
+        if self.processor.control.is_cancelled():
+            self.remaining.extend(self.queue.drain())
+        if self.remaining:
+            # 未处理的文件写回待处理列表，下次可继续处理
+            self.processor.save_file_list(self.remaining)
+            logger.info(f"处理已取消，{len(self.remaining)} 个视频保留在待处理列表中")
         #self.processor.cleanup_tmp_dirs()  # 清理临时目录
         #self.tmp_manager.cleanup_tmp_dirs()  # 清理临时目录
         self.finished.emit()
 
+    def _work_loop(self):
+        control = self.processor.control
+        while True:
+            try:
+                control.wait_if_paused()
+            except JobCancelled:
+                return
+            job = self.queue.get(timeout=0.2)
+            if job is None:
+                # 没有待取出和正在处理的任务时结束；有任务在处理时继续等待可能的追加
+                if self.queue.finish_if_empty():
+                    return
+                continue
+            limiter = self.concurrency.limiter_for(self.queue.path(job).parent)
+            ticket = limiter.try_acquire()
+            if ticket is None:
+                # 该卷的并发已满：放回队列，先处理其他卷的任务，该卷有空位后再取出
+                self.queue.defer(job, limiter)
+                continue
+            status = JobTable.FAILED
+            try:
+                status = self._run_job(job, limiter, ticket)
+            except Exception as e:
+                # 单个任务的意外错误不结束工作线程，该任务记为失败
+                msg = f"处理失败（原视频保留）: {self.queue.path(job)}，错误: {str(e)}"
+                logger.error(msg)
+                self.processor.progress_updated.emit(msg, False)
+            finally:
+                self.queue.mark(job, status, limiter)
+            if status == JobTable.PENDING:
+                return  # 已取消
+
+    def _run_job(self, job, limiter, ticket):
+        """处理一个已占用卷并发名额的任务，返回其状态（分段系列逐段处理时为各段的状态列表）
+
+        取消时返回PENDING（未处理的文件已加入remaining）。
+        """
+        file = self.queue.path(job)
+        segments = self.queue.series(job)  # 分段系列时整个系列作为一个任务
+        files = segments or [file]
+        result = None
+        try:
+            size = 0
+            for f in files:
+                try:
+                    size += f.stat().st_size
+                except OSError:
+                    pass
+            if segments:
+                result = self.processor.process_series(segments)
+            else:
+                result = self.processor.process_video(file)
+            # 处理结果已经通过processor的信号发出
+        finally:
+            # 只有成功的任务计入吞吐量，失败的任务通常很快结束，计入会虚高
+            measured = result is not None and result.success and not result.metrics.get('cancelled')
+            limiter.release(ticket, size if measured else 0, result.elapsed if result is not None else 0.0)
+        if result.metrics.get('cancelled'):
+            with self._lock:
+                # 分段系列逐段处理时只保留尚未处理的段
+                self.remaining.extend(result.metrics.get('remaining', [str(f) for f in files]))
+            return JobTable.PENDING
+        if segments and 'results' in result.metrics:
+            # 无法拼接、逐段处理时各段分别记录
+            return [JobTable.DONE if r['success'] else JobTable.FAILED for r in result.metrics['results']]
+        return JobTable.DONE if result else JobTable.FAILED
+
 class VideoProcessor(QObject):
     # 信号定义
     progress_updated = pyqtSignal(str, bool)  # 处理进度信号(消息, 是否成功)
     process_completed = pyqtSignal()  # 处理完成信号
+    # 修复方式，按代价从低到高：只修补头部、按流复制、容错重封装、从mdat重建索引
+    STRATEGIES = ('header_patch', 'copy', 'tolerant', 'mdat_rebuild')
+    DEFAULT_STRATEGIES = ('copy', 'tolerant', 'mdat_rebuild')
+    TOLERANT_ARGS = ('-fflags', '+genpts+igndts', '-err_detect', 'ignore_err')
+    SEGMENT_PATTERN = r'^(.+)_(\d{3})\.mp4$'  # 分段文件名：系列名_段号.mp4
     
     def __init__(self, ffmpeg_mgr, config_mgr, app_dir):
         super().__init__()
         self.ffmpeg_mgr = ffmpeg_mgr
         self.config_mgr = config_mgr
         self.user_dir = app_dir
+        self.commit_batcher = CommitBatcher(config_mgr.get('commit_batch_size', 16),
+                                            config_mgr.get('fsync_commits', True))
+        self.control = JobControl(config_mgr)  # 当前批次的暂停/取消/限速控制
+        self.priority = ProcessPriority.from_config(config_mgr)  # ffmpeg子进程优先级
+        self.tmp_manager = None  # 处理中由确认对话框设置，用于追加目录的临时目录
+        self.engine_selector = EngineSelector(ffmpeg_mgr, config_mgr)  # 重封装后端
+        io_hints.set_enabled(config_mgr.get('page_cache_hints', True))
+        for name in config_mgr.get('repair_strategies', []):
+            if name not in self.STRATEGIES:
+                logger.error(f"未知的修复方式: {name}，已忽略（可用: {'、'.join(self.STRATEGIES)}）")
         # self.created_tmp_dirs = []  # 移除
         # self.dir_tmp_map = {}       # 由外部传入
 
-    def scan_directory(self, directory: str, recursive: bool = True) -> list:
-        """扫描目录获取MP4文件列表"""
+    def scan_roots(self, roots, recursive: bool = True) -> JobTable:
+        """扫描多个根目录，重叠的根目录只扫描一次，结果按规范化路径去重"""
+        files = JobTable()
+        for root in normalize_roots(roots, recursive):
+            files.extend(self.scan_directory(root, recursive, save_list=False))
+        # 合并后编号变化，重新识别分段系列
+        self._group_segments(files)
+        if len(roots) > 1:
+            logger.info(f"{len(roots)} 个根目录共找到 {len(files)} 个需要处理的MP4文件")
+        if not self.save_file_list(files):
+            return JobTable()
+        return files
+
+    def scan_directory(self, directory: str, recursive: bool = True, save_list: bool = True) -> JobTable:
+        """扫描目录获取MP4文件列表（JobTable）"""
         directory = Path(directory)
+        files = JobTable()
         if not directory.exists() or not directory.is_dir():
             logger.error(f"目录不存在: {directory}")
-            return []
-        pattern = '**/*.mp4' if recursive else '*.mp4'
-        
-        all_files = list(directory.glob(pattern))
-        skip_pattern = self.config_mgr.get('skip_pattern', '^.*meta$')
-        
-        try:
-            regex = re.compile(skip_pattern)
-            # 过滤掉匹配正则表达式的文件
-            files = [f for f in all_files if not regex.search(f.stem)]
-            
-            # 记录跳过的文件
-            skipped = [f for f in all_files if regex.search(f.stem)]
-            for f in skipped:
-                logger.info(f"跳过了匹配正则表达式的视频: {f}")
-                #self.progress_updated.emit(f"跳过: {f.name}", True)
-        except re.error as e:
-            logger.error(f"正则表达式无效: {str(e)}")
-            files = all_files
+            return files
+        # 规则在遍历时即时判断，被排除的目录不会进入
+        def on_skip(path):
+            logger.info(f"跳过了匹配正则表达式的视频: {path}")
+        rules = ScanRuleSet.from_config(self.config_mgr, on_skip)
+        walker = ParallelWalker(rules, self.config_mgr.get('scan_threads', 8))
+        scan_start = time.perf_counter()
+        # 规则已经stat过或Windows下DirEntry自带stat时顺便记录大小和修改时间
+        with_stat = rules.needs_stat or os.name == 'nt'
+        for entry in walker.walk(directory, recursive):
+            files.add_entry(entry, with_stat)
+        # 并行遍历的产出顺序不确定，排序后结果确定
+        files.sort()
+        self._group_segments(files)
+        file_logger.info(f"扫描 {directory} 耗时 {time.perf_counter() - scan_start:.2f} 秒")
         
         logger.info(f"找到 {len(files)} 个需要处理的MP4文件")
         
         # 保存文件列表
+        if save_list and not self.save_file_list(files):
+            return JobTable()
+            
+        return files
+
+    def _group_segments(self, files: JobTable):
+        """concat_segments开启时识别分段录制的系列，每个系列修复后一次拼接为一个视频"""
+        if not self.config_mgr.get('concat_segments', False):
+            return
+        pattern = self._segment_pattern()
+        if pattern is None:
+            return
+        count = files.group_series(pattern)
+        if count:
+            segments = sum(len(indices) for indices in files.series.values())
+            logger.info(f"识别到 {count} 个分段系列，共 {segments} 段，每个系列将拼接为一个视频")
+
+    def save_file_list(self, files):
+        """保存待处理文件列表到preprocesslist.txt"""
         list_file = self.user_dir/'preprocesslist.txt'
         try:
             with open(list_file, 'w', encoding='utf-8') as f:
                 for file in files:
-                    f.write(str(file) + '\n')
+                    f.write(f"{file}\n")
         except Exception as e:
             logger.error(f"保存文件列表失败: {str(e)}")
-            return []
-            
-        return files
+            return False
+        return True
         
     def process_video(self, input_file: Path, tmp_dir: Path = None):
-        """处理单个视频文件，所有输出先写到tmp目录"""
+        """处理单个视频文件，所有输出先写到tmp目录，返回JobResult"""
+        result = self._process_video(input_file, tmp_dir)
+        # 结构化结果只写文件（JSON Lines日志中可直接解析）
+        file_logger.info(f"处理结果: {'成功' if result else '失败'} {result.path}",
+                         extra={'event': 'job_result', 'fields': result.to_dict()})
+        return result
+
+    def _process_video(self, input_file: Path, tmp_dir: Path = None):
+        start = time.perf_counter()
         self.progress_updated.emit("\n---------------------------------------------------------------------------------------------------------------------", True)
         input_file = Path(input_file)
         suffix = self.get_output_suffix()
         orig_dir = input_file.parent
-
-        # 只为每个目录使用外部传入的tmp
-        if tmp_dir is None:
-            if hasattr(self, 'dir_tmp_map') and orig_dir in self.dir_tmp_map:
-                tmp_dir = self.dir_tmp_map[orig_dir]
-            else:
-                raise Exception("未找到临时目录映射，请检查处理流程")
-        tmp_output = tmp_dir / (input_file.stem + (suffix or '') + '.mp4')
-        ffmpeg_path = self.ffmpeg_mgr.get_ffmpeg_path()
+        tmp_output = None
+        metrics = {}
 
         try:
+            # 原视频目录不存在或不可写时在这里抛出，按处理失败返回
+            if tmp_dir is None:
+                tmp_dir = self._tmp_dir_for(orig_dir)
+            tmp_output = tmp_dir / (input_file.stem + (suffix or '') + '.mp4')
             logger = logging.getLogger('mp4recovery')
             msg1 = f"原视频路径: {input_file}"
             #logger.info(msg1)
@@ -105,72 +290,398 @@ class VideoProcessor(QObject):
             #logger.info(msg2)
             self.progress_updated.emit(msg2, True)
 
-            # 关键：防止ffmpeg弹出cmd窗口
-            startupinfo = None
-            if hasattr(subprocess, 'STARTUPINFO'):
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            cmd = [ffmpeg_path, '-i', str(input_file), '-map_metadata', '0', '-c', 'copy', str(tmp_output)]
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',  # 指定编码为UTF-8
-                startupinfo=startupinfo
-            )
-            if result.returncode != 0:
-                logger.error(f"FFmpeg错误: {result.stderr}")
-                self.progress_updated.emit(f"FFmpeg错误: {result.stderr}", False)
-            if not tmp_output.exists():
-                msg3 = f"输出文件未生成: {input_file}"
-                #logger.info(msg3)
-                self.progress_updated.emit(msg3, False)
-            orig_size = input_file.stat().st_size
-            new_size = tmp_output.stat().st_size
-            # 仅当原视频大于100MB时才判断大小差异
-            if orig_size > 100 * 1024 * 1024:
-                size_diff = abs(new_size - orig_size) / orig_size
-                if size_diff > 0.25:
-                    msg = (f"处理失败（原视频保留）: 视频大小差距过大，超过25%（原视频大于100MB才判断差距）\n"
-                          f"原视频：{input_file} ({orig_size:,} 字节)\n"
-                          f"生成视频：{tmp_output} ({new_size:,} 字节)")
-                    tmp_output.unlink()
-                    logger.error(msg)
-                    self.progress_updated.emit(msg, False)
-                    return False
-            final_output = orig_dir / tmp_output.name
-            # 如果后缀为空，直接覆盖原视频，不删除input_file
-            if suffix == '':
-                shutil.move(str(tmp_output), str(input_file))
-                msg4 = f"成功处理，处理后视频路径: {input_file}"
-                #logger.info(msg4)
-                self.progress_updated.emit(msg4, True)
-            else:
-                shutil.move(str(tmp_output), str(final_output))
-                msg5 = f"成功处理，处理后视频路径: {final_output}"
-                #logger.info(msg5)
-                self.progress_updated.emit(msg5, True)
-                # 同步处理关联文件和删除原视频
-                if self.config_mgr.get('delete_original', True):
-                    if self.config_mgr.get('sync_ass', True):
-                        self._sync_associated_file(input_file, suffix, '.ass')
-                    if self.config_mgr.get('sync_xml', False):
-                        self._sync_associated_file(input_file, suffix, '.xml')
-                    input_file.unlink()
-                    file_logger.info(f"删除原视频: {input_file}")
-            
-            return True
+            strategy = self._repair(input_file, tmp_output, suffix, metrics)
+            if strategy is None:
+                tried = '、'.join(a['strategy'] for a in metrics['attempts']) or '无'
+                msg = f"处理失败（原视频保留）: {input_file}，所有修复方式均失败（已尝试: {tried}）"
+                logger.error(msg)
+                self.progress_updated.emit(msg, False)
+                return JobResult(input_file, False, msg, elapsed=time.perf_counter() - start, metrics=metrics)
+            # 提交阶段：输出移动、关联文件重命名、删除原视频作为一个整体，失败时回滚
+            unit = CommitUnit(tmp_dir)
+            try:
+                # 如果后缀为空，直接覆盖原视频（原视频暂存，落盘后删除）
+                if suffix == '':
+                    final_output = input_file
+                    unit.move(tmp_output, input_file)
+                else:
+                    final_output = orig_dir / tmp_output.name
+                    unit.move(tmp_output, final_output)
+                    # 同步处理关联文件和删除原视频
+                    if self.config_mgr.get('delete_original', True):
+                        if self.config_mgr.get('sync_ass', True):
+                            self._sync_associated_file(unit, input_file, suffix, '.ass')
+                        if self.config_mgr.get('sync_xml', False):
+                            self._sync_associated_file(unit, input_file, suffix, '.xml')
+                        unit.stage_delete(input_file)
+            except Exception:
+                unit.rollback()
+                raise
+            self.commit_batcher.add(unit)
+            msg4 = f"成功处理，处理后视频路径: {final_output}"
+            #logger.info(msg4)
+            self.progress_updated.emit(msg4, True)
+
+            return JobResult(input_file, True, "成功处理", output=final_output,
+                             elapsed=time.perf_counter() - start, metrics=metrics)
+        except JobCancelled:
+            msg = f"已取消: {input_file}"
+            self.progress_updated.emit(msg, False)
+            if tmp_output is not None and tmp_output.exists():
+                tmp_output.unlink()
+            return JobResult(input_file, False, msg, elapsed=time.perf_counter() - start,
+                             metrics={'cancelled': True})
         except Exception as e:
             msg = f"处理失败（原视频保留）: {input_file}，错误: {str(e)}"
             logger.error(msg)
             self.progress_updated.emit(msg, False)
-            if tmp_output.exists():
+            if tmp_output is not None and tmp_output.exists():
                 tmp_output.unlink()
-            return False
+            return JobResult(input_file, False, msg, elapsed=time.perf_counter() - start)
     
+    def process_series(self, segments, tmp_dir: Path = None):
+        """把分段录制的一个系列修复并一次拼接为一个视频，返回JobResult（路径为首段）"""
+        result = self._process_series([Path(s) for s in segments], tmp_dir)
+        file_logger.info(f"处理结果: {'成功' if result else '失败'} {result.path}",
+                         extra={'event': 'job_result', 'fields': result.to_dict()})
+        return result
+
+    def _process_series(self, segments, tmp_dir: Path = None):
+        start = time.perf_counter()
+        self.progress_updated.emit("\n---------------------------------------------------------------------------------------------------------------------", True)
+        head = segments[0]
+        suffix = self.get_output_suffix()
+        orig_dir = head.parent
+        if tmp_dir is None:
+            tmp_dir = self._tmp_dir_for(orig_dir)
+        name = self._segment_pattern().match(head.name).group(1)
+        tmp_output = tmp_dir / (name + suffix + '.mp4')
+        final_output = orig_dir / tmp_output.name
+        list_file = tmp_dir / (name + '.ffconcat')
+        # 覆盖原视频或删除原视频时各段都会被移除，关联文件随拼接后的视频一起处理
+        remove_segments = suffix == '' or self.config_mgr.get('delete_original', True)
+        sidecars = self._series_sidecars(segments) if remove_segments else {}
+        rebuilt = []  # 没有moov、先从mdat重建的段（临时文件）
+        metrics = {'segments': len(segments)}
+
+        try:
+            self.progress_updated.emit(f"正在拼接分段系列（{len(segments)} 段）: {orig_dir / name}", True)
+            try:
+                metrics.update(self._concat_series(segments, tmp_output, final_output, list_file,
+                                                   suffix, sidecars, rebuilt))
+            except JobCancelled:
+                raise
+            except (RemuxError, RepairFailed, RecoveryError, HeaderPatchError, OSError, ValueError, struct.error) as e:
+                reason = e.stderr[-500:] if isinstance(e, RemuxError) else str(e)
+                msg = f"分段系列无法一次拼接，改为逐段处理: {orig_dir / name}，原因: {reason}"
+                logger.warning(msg)
+                self.progress_updated.emit(msg, False)
+                if tmp_output.exists():
+                    tmp_output.unlink()
+                return self._process_segments(segments, start, tmp_dir)
+            finally:
+                for f in [list_file, *rebuilt]:
+                    if f.exists():
+                        f.unlink()
+
+            unit = CommitUnit(tmp_dir)
+            try:
+                unit.move(tmp_output, final_output)
+                if remove_segments:
+                    for ext, sources in sidecars.items():
+                        self._sync_series_sidecar(unit, tmp_dir, final_output, ext, sources, metrics['offsets'])
+                    for seg in segments:
+                        if path_key(seg) != path_key(final_output):
+                            unit.stage_delete(seg)
+            except Exception:
+                unit.rollback()
+                raise
+            self.commit_batcher.add(unit)
+            self.progress_updated.emit(f"成功处理，{len(segments)} 段已拼接为: {final_output}", True)
+            return JobResult(head, True, "成功处理", output=final_output,
+                             elapsed=time.perf_counter() - start, metrics=metrics)
+        except JobCancelled:
+            msg = f"已取消: {orig_dir / name}"
+            self.progress_updated.emit(msg, False)
+            if tmp_output.exists():
+                tmp_output.unlink()
+            return JobResult(head, False, msg, elapsed=time.perf_counter() - start,
+                             metrics={'cancelled': True})
+        except Exception as e:
+            msg = f"处理失败（原视频保留）: {head}，错误: {str(e)}"
+            logger.error(msg)
+            self.progress_updated.emit(msg, False)
+            if tmp_output.exists():
+                tmp_output.unlink()
+            return JobResult(head, False, msg, elapsed=time.perf_counter() - start, metrics=metrics)
+
+    def _concat_series(self, segments, tmp_output, final_output, list_file, suffix, sidecars, rebuilt):
+        """把各段一次流复制拼接到tmp_output并校验，返回拼接信息；无法拼接时抛出异常
+
+        有完整moov的段直接作为concat的输入，按sample表计算的时长写入列表；
+        没有moov的段先从mdat重建索引。先按流复制拼接，失败或校验不通过时改用容错方式。
+        """
+        engine = self.engine_selector.engines['ffmpeg']
+        if not engine.available() or not self.ffmpeg_mgr.capabilities.get('demux:concat', True):
+            raise RepairFailed("ffmpeg不可用或不支持concat分离器")
+        if final_output.exists() and path_key(final_output) not in {path_key(s) for s in segments}:
+            raise RepairFailed(f"输出文件已存在: {final_output}")
+        inputs, durations = [], []
+        for seg in segments:
+            if has_moov(seg):
+                inputs.append(seg)
+                try:
+                    durations.append(HeaderPatch(seg).stats['duration'])
+                except (HeaderPatchError, struct.error):
+                    durations.append(None)  # 由ffmpeg自行判断
+                continue
+            # 没有moov的段不能直接读取，只有这些段多一次读写
+            if 'mdat_rebuild' not in self._repair_strategies(suffix):
+                raise RepairFailed(f"分段没有moov: {seg}")
+            rebuilt_file = list_file.with_name(f"{seg.stem}.rebuilt.mp4")
+            rebuilt.append(rebuilt_file)
+            self._try_mdat_rebuild(seg, rebuilt_file)
+            inputs.append(rebuilt_file)
+            durations.append(self._verify_output(seg, rebuilt_file)['duration'])
+
+        # 各段在拼接后视频中的起始时间，之前有时长未知的段时为None
+        offsets, total = [], 0.0
+        for duration in durations:
+            offsets.append(total)
+            total = total + duration if total is not None and duration else None
+        for ext, sources in sidecars.items():
+            if any(offsets[k] is None for k, _ in sources):
+                raise RepairFailed(f"无法确定分段时长，不能合并{ext}文件")
+
+        write_concat_list(list_file, inputs, durations)
+        orig_size = sum(s.stat().st_size for s in segments)
+        expected = sum(durations) if all(durations) else None
+        error = None
+        for mode, input_args in (('copy', ()), ('tolerant', self.TOLERANT_ARGS)):
+            if tmp_output.exists():
+                tmp_output.unlink()
+            try:
+                engine.concat(list_file, tmp_output, self.control, self.priority, input_args)
+                stats = self._verify_output(segments[0], tmp_output, orig_size)
+                if expected and stats['duration'] < expected * 0.9:
+                    raise RepairFailed(f"拼接后时长 {stats['duration']} 秒，少于各段合计 {expected:.3f} 秒")
+            except (RemuxError, RepairFailed) as e:
+                error = e
+                file_logger.warning(f"拼接方式 {mode} 失败: {final_output}，原因: {str(e)}")
+                continue
+            return {'strategy': f'concat_{mode}', 'duration': stats['duration'],
+                    'offsets': offsets, 'rebuilt': len(rebuilt)}
+        raise error
+
+    def _series_sidecars(self, segments):
+        """各段的关联文件 {扩展名: [(段序号, 文件)]}，只包含sync_ass/sync_xml开启的类型"""
+        found = {}
+        for ext, key, default in (('.ass', 'sync_ass', True), ('.xml', 'sync_xml', False)):
+            if not self.config_mgr.get(key, default):
+                continue
+            sources = [(k, seg.with_suffix(ext)) for k, seg in enumerate(segments) if seg.with_suffix(ext).exists()]
+            if sources:
+                found[ext] = sources
+        return found
+
+    def _sync_series_sidecar(self, unit: CommitUnit, tmp_dir: Path, final_output: Path, ext, sources, offsets):
+        """分段系列的关联文件：只有首段有时直接重命名，否则按各段起始时间平移后合并为一个"""
+        new_file = final_output.with_suffix(ext)
+        merged = tmp_dir / new_file.name
+        try:
+            if len(sources) == 1 and sources[0][0] == 0:
+                unit.rename(sources[0][1], new_file)
+            else:
+                if new_file.exists():
+                    raise FileExistsError(f"目标文件已存在: {new_file}")
+                merge_sidecars(ext, [(path, offsets[k]) for k, path in sources], merged)
+                unit.move(merged, new_file)
+                for _, path in sources:
+                    unit.stage_delete(path)
+            file_logger.info(f"同步处理{ext}文件: {len(sources)} 个 -> {new_file}")
+            logger.info(f"成功同步{ext}文件: {new_file.name}")
+        except Exception as e:
+            if merged.exists():
+                merged.unlink()
+            error_msg = f"同步处理{ext}文件失败: {str(e)}"
+            file_logger.error(error_msg)
+            raise Exception(error_msg) from e
+
+    def _process_segments(self, segments, start, tmp_dir: Path = None):
+        """无法一次拼接时逐段单独修复，返回汇总的JobResult"""
+        results = []
+        for k, seg in enumerate(segments):
+            result = self._process_video(seg, tmp_dir)
+            results.append(result.to_dict())
+            if result.metrics.get('cancelled'):
+                return JobResult(segments[0], False, result.message, elapsed=time.perf_counter() - start,
+                                 metrics={'cancelled': True, 'results': results,
+                                          'remaining': [str(s) for s in segments[k:]]})
+        failed = [r['path'] for r in results if not r['success']]
+        msg = f"逐段处理完成，{len(failed)} 段未能修复" if failed else "逐段处理完成"
+        return JobResult(segments[0], not failed, msg, elapsed=time.perf_counter() - start,
+                         metrics={'concat': False, 'results': results})
+
+    def _segment_pattern(self):
+        return compile_pattern(self.config_mgr.get('segment_pattern', self.SEGMENT_PATTERN))
+
+    def _tmp_dir_for(self, orig_dir: Path):
+        """只为每个目录使用外部传入的tmp"""
+        if hasattr(self, 'dir_tmp_map') and orig_dir in self.dir_tmp_map:
+            return self.dir_tmp_map[orig_dir]
+        if self.tmp_manager is not None:
+            # 处理过程中追加的目录，按需创建临时目录
+            return self.tmp_manager.get_tmp_dir(orig_dir)
+        raise Exception("未找到临时目录映射，请检查处理流程")
+
+    def _repair_strategies(self, suffix):
+        """本文件依次尝试的修复方式"""
+        names = [n for n in self.config_mgr.get('repair_strategies', list(self.DEFAULT_STRATEGIES))
+                 if n in self.STRATEGIES]
+        # 保留原视频时先克隆原文件并只修补头部，克隆与原文件共享数据块
+        if (self.config_mgr.get('reflink_repair', False) and suffix != ''
+                and not self.config_mgr.get('delete_original', True) and 'header_patch' not in names):
+            names.insert(0, 'header_patch')
+        if not self.config_mgr.get('mdat_recovery', True):
+            names = [n for n in names if n != 'mdat_rebuild']
+        return list(dict.fromkeys(names))
+
+    def _repair(self, input_file: Path, tmp_output: Path, suffix, metrics):
+        """按代价从低到高尝试各修复方式，只在失败或输出未通过校验时升级到下一种
+
+        返回成功的修复方式并记入metrics['strategy']；全部失败时返回None。
+        """
+        attempts = metrics.setdefault('attempts', [])
+        for name in self._repair_strategies(suffix):
+            if tmp_output.exists():
+                tmp_output.unlink()
+            stage = 'repair'
+            try:
+                info = getattr(self, f'_try_{name}')(input_file, tmp_output)
+                if info is None:
+                    continue  # 不适用于该文件
+                stage = 'verify'
+                info['verified'] = self._verify_output(input_file, tmp_output, strategy=name)
+            except JobCancelled:
+                raise
+            except RemuxError as e:
+                logger.error(f"FFmpeg错误: {e.stderr}")
+                self.progress_updated.emit(f"FFmpeg错误: {e.stderr}", False)
+                attempts.append({'strategy': name, 'stage': stage, 'error': e.stderr[-500:]})
+            except (RepairFailed, RecoveryError, HeaderPatchError, OSError, ValueError, struct.error) as e:
+                what = '输出未通过校验' if stage == 'verify' else '失败'
+                msg = f"修复方式 {name} {what}: {input_file}，原因: {str(e)}"
+                logger.error(msg)
+                self.progress_updated.emit(msg, False)
+                # stage区分修复本身失败（repair）和输出未通过校验（verify）
+                attempts.append({'strategy': name, 'stage': stage, 'error': str(e)})
+            else:
+                metrics['strategy'] = name
+                metrics[name] = info
+                if attempts:
+                    self.progress_updated.emit(f"已改用 {name} 修复: {input_file}", True)
+                return name
+        if tmp_output.exists():
+            tmp_output.unlink()
+        return None
+
+    def _verify_output(self, input_file: Path, tmp_output: Path, orig_size=None, strategy=None):
+        """对照原视频校验输出，不通过时抛出RepairFailed
+
+        输出需已生成、结构完整、时长大于0、每个轨道都有sample，原视频中的视频/音频轨道都在；
+        原视频大于100MB时大小差距不超过25%；只修补头部时输出的moov必须与原视频不同。
+        返回输出的头部信息（轨道数、时长、各轨道sample数）；orig_size用于多个输入（分段系列）的总大小。
+        """
+        if not tmp_output.exists():
+            raise RepairFailed("输出文件未生成")
+        if orig_size is None:
+            orig_size = input_file.stat().st_size
+        new_size = tmp_output.stat().st_size
+        # 仅当原视频大于100MB时才判断大小差异
+        if orig_size > 100 * 1024 * 1024 and abs(new_size - orig_size) / orig_size > 0.25:
+            raise RepairFailed(f"视频大小差距过大，超过25%（原视频 {orig_size:,} 字节，"
+                               f"生成视频 {new_size:,} 字节）")
+        try:
+            stats = verify_mp4(tmp_output, input_file)
+            if strategy == 'header_patch' and read_moov(tmp_output)[2] == read_moov(input_file)[2]:
+                raise RepairFailed("输出与原视频相同，只修补头部无效")
+        except (HeaderPatchError, struct.error) as e:
+            raise RepairFailed(f"输出结构校验失败: {str(e)}")
+        return stats
+
+    def _try_header_patch(self, input_file: Path, tmp_output: Path):
+        """克隆原文件（不支持reflink时普通复制）并只改写头部字段；无法只修补头部时不适用"""
+        try:
+            patch = HeaderPatch(input_file)
+        except (HeaderPatchError, struct.error) as e:
+            file_logger.info(f"无法只修补头部: {input_file}，原因: {str(e)}")
+            return None
+        if not patch.writes:
+            # 头部时长已与sample表一致，克隆出的文件与原文件相同，修补无效
+            file_logger.info(f"头部字段无需改写，只修补头部无效: {input_file}")
+            return None
+        cloned = reflink(input_file, tmp_output)
+        if not cloned:
+            self._copy_file(input_file, tmp_output)
+        patch.apply(tmp_output)
+        stats = dict(patch.stats, reflink=cloned)
+        self.progress_updated.emit(
+            f"已{'克隆' if cloned else '复制'}原视频并修补头部: 改写 {stats['patched_fields']} 个字段", True)
+        return stats
+
+    def _try_copy(self, input_file: Path, tmp_output: Path):
+        """按流复制重封装（-c copy），后端由EngineSelector选择"""
+        engine = self.engine_selector.select(input_file)
+        try:
+            info = engine.remux(input_file, tmp_output, self.control, self.priority)
+        except RemuxError as e:
+            if engine.name == 'ffmpeg':
+                raise
+            # 进程内后端失败时改用ffmpeg子进程重试一次
+            logger.warning(f"{engine.name}重封装失败（{e}），改用ffmpeg: {input_file}")
+            tmp_output.unlink(missing_ok=True)
+            engine = self.engine_selector.engines['ffmpeg']
+            info = engine.remux(input_file, tmp_output, self.control, self.priority)
+        return dict(info, engine=engine.name)
+
+    def _try_tolerant(self, input_file: Path, tmp_output: Path):
+        """容错重封装：重新生成时间戳、忽略DTS和解码错误"""
+        engine = self.engine_selector.engines['ffmpeg']
+        info = engine.remux(input_file, tmp_output, self.control, self.priority, self.TOLERANT_ARGS)
+        return dict(info, engine=engine.name)
+
+    def _try_mdat_rebuild(self, input_file: Path, tmp_output: Path):
+        """录制中断导致没有moov时，扫描mdat重建sample表；有完整moov时不适用"""
+        if has_moov(input_file):
+            return None
+        self.progress_updated.emit(f"未找到moov，尝试从mdat重建索引: {input_file}", True)
+        stats = MdatRecovery(input_file, self.config_mgr.get('recovery_fps', 30)).recover(
+            tmp_output, self._controlled_copy, self.control.checkpoint)
+        self.progress_updated.emit(
+            f"已从mdat重建索引: 视频帧 {stats['video_samples']} 个，音频帧 {stats['audio_samples']} 个", True)
+        return stats
+
+    def _copy_file(self, src: Path, dst: Path):
+        """普通复制，受暂停/取消/限速控制，不占用页缓存"""
+        io_hints.copy_file(src, dst, self.control.checkpoint)
+
+    def _controlled_copy(self, out, src, start, end, chunk=8 * 1024 * 1024):
+        """受暂停/取消/限速控制的数据复制"""
+        pos = start
+        while pos < end:
+            n = min(chunk, end - pos)
+            out.write(src[pos:pos + n])
+            pos += n
+            self.control.checkpoint(n)
+
     def process_files(self, files):
-        """异步处理文件列表"""
-        self.worker = ProcessWorker(self, files)
+        """异步处理文件列表，所有文件共用一个工作线程池"""
+        self.control = JobControl(self.config_mgr)
+        self.priority = ProcessPriority.from_config(self.config_mgr)
+        if isinstance(files, JobTable) and not files.series:
+            # 从待处理列表读取的任务表没有分组信息
+            self._group_segments(files)
+        self.worker = ProcessWorker(self, files, ConcurrencyController(self.config_mgr))
         self.worker.start()
         return self.worker
     
@@ -180,8 +691,8 @@ class VideoProcessor(QObject):
         if suffix is None:
             suffix = ''  # 默认后缀
         return suffix
-    def _sync_associated_file(self, video_file: Path, suffix: str, ext: str):
-        """同步处理关联文件"""
+    def _sync_associated_file(self, unit: CommitUnit, video_file: Path, suffix: str, ext: str):
+        """同步处理关联文件（在提交单元内重命名，失败时抛出异常使整个提交回滚）"""
         associated_file = video_file.with_suffix(ext)
         if associated_file.exists():
             try:
@@ -189,13 +700,15 @@ class VideoProcessor(QObject):
                 new_file = video_file.with_name(video_file.stem + suffix + ext)
                 
                 # 重命名关联文件
-                associated_file.rename(new_file)
+                unit.rename(associated_file, new_file)
                 file_logger.info(f"同步处理{ext}文件: {associated_file} -> {new_file}")
                 logger.info(f"成功同步{ext}文件: {new_file.name}")
                 
             except Exception as e:
                 error_msg = f"同步处理{ext}文件失败: {str(e)}"
-                logger.error(error_msg)
                 file_logger.error(error_msg)
-                self.progress_updated.emit(error_msg, False)
+                raise Exception(error_msg) from e
 
+    def flush_commits(self):
+        """把尚未落盘的提交统一fsync并删除暂存的原视频，批处理结束时调用"""
+        self.commit_batcher.flush()
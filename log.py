@@ -1,8 +1,16 @@
 import logging
+import logging.handlers
+import atexit
+import json
+import queue
 from pathlib import Path
 from PyQt5.QtCore import QObject, pyqtSignal
 from datetime import datetime
 
+FILE_ONLY_LOGGER = 'mp4recovery.fileonly'
+_listener = None
+_signal = None
+
 class Signaller(QObject):
     signal = pyqtSignal(str, bool)
 
@@ -10,35 +18,94 @@ class QtHandler(logging.Handler):
     def __init__(self):
         super().__init__()
         self.signaller = Signaller()
-        
+
     def emit(self, record):
         msg = self.format(record)
         # Error级别的日志标记为失败
         success = record.levelno < logging.ERROR
         self.signaller.signal.emit(msg, success)
 
-def setup_logger(app_dir: Path):
-    """配置日志系统"""
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志一行JSON，结构化字段放在 event/fields 中，供日志采集程序直接解析"""
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        event = getattr(record, 'event', None)
+        if event:
+            entry['event'] = event
+            entry['fields'] = getattr(record, 'fields', {})
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _NotFileOnly(logging.Filter):
+    """只写文件的日志不发往界面"""
+    def filter(self, record):
+        return record.name != FILE_ONLY_LOGGER
+
+def setup_logger(app_dir: Path, config_mgr=None):
+    """配置日志系统
+
+    所有记录先进入队列，由后台QueueListener线程写文件和转发到界面，
+    工作线程不会因磁盘写入或跨线程信号而阻塞。
+    """
+    global _listener, _signal
+    if _listener is not None:
+        return _signal
+
+    def get(key, default):
+        return config_mgr.get(key, default) if config_mgr is not None else default
+
+    formatter = logging.Formatter('[%(asctime)s] %(message)s')
+    max_bytes = int(get('log_max_mb', 10) * 1024 * 1024)
+    backup_count = get('log_backup_count', 5)
+
+    # 文件处理器（按大小轮转）
+    fh = logging.handlers.RotatingFileHandler(
+        app_dir/'log.log', maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    fh.setFormatter(formatter)
+    handlers = [fh]
+
+    # 可选的JSON Lines结构化日志
+    if get('json_log', False):
+        jh = logging.handlers.RotatingFileHandler(
+            app_dir/'log.jsonl', maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        jh.setFormatter(JsonLinesFormatter())
+        handlers.append(jh)
+
+    # Qt处理器，只接收主记录器的日志
+    qt_handler = QtHandler()
+    qt_handler.setFormatter(formatter)
+    qt_handler.addFilter(_NotFileOnly())
+    handlers.append(qt_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+
     # 创建主日志记录器
     logger = logging.getLogger('mp4recovery')
     logger.setLevel(logging.INFO)
-    
-    # 文件处理器
-    log_file = app_dir/'log.log'
-    fh = logging.FileHandler(log_file, encoding='utf-8', mode='a')  # 使用追加模式
-    formatter = logging.Formatter('[%(asctime)s] %(message)s')
-    fh.setFormatter(formatter)
-    
+    logger.addHandler(queue_handler)
+
     # 创建一个不带Qt处理器的文件记录器
-    file_logger = logging.getLogger('mp4recovery.fileonly')
+    file_logger = logging.getLogger(FILE_ONLY_LOGGER)
     file_logger.setLevel(logging.INFO)
     file_logger.propagate = False  # 阻止日志向上传播到父记录器
-    file_logger.addHandler(fh)  # 只添加文件处理器
-    
-    # 主记录器添加文件和Qt处理器
-    logger.addHandler(fh)
-    qt_handler = QtHandler()
-    qt_handler.setFormatter(formatter)
-    logger.addHandler(qt_handler)
-    
-    return qt_handler.signaller.signal
\ No newline at end of file
+    file_logger.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logger)
+
+    _signal = qt_handler.signaller.signal
+    return _signal
+
+def shutdown_logger():
+    """停止后台日志线程并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
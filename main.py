@@ -1,13 +1,22 @@
+import time
+_START_TIME = time.perf_counter()  # 启动计时起点（在重量级导入之前）
+
 import sys
 import os
+import argparse
+import signal
+import logging
 from pathlib import Path
-from PyQt5.QtWidgets import QApplication
+from PyQt5.QtWidgets import QApplication, QMessageBox
+from PyQt5.QtCore import QTimer
 from ui.main_window import MainWindow
 from core.config_manager import ConfigManager
-from core.ffmpeg_manager import FFmpegManager
+from core.ffmpeg_manager import FFmpegManager, FFmpegInitWorker
 from core.video_processor import VideoProcessor
 import log
 
+logger = logging.getLogger('mp4recovery')
+
 def get_app_data_dir():
     """获取应用数据目录，兼容Windows，定位到当前用户AppData/Local/Mp4recovery"""
     if os.name == 'nt':
@@ -20,32 +29,120 @@ def get_app_data_dir():
         # 其他系统放在用户主目录下的隐藏文件夹
         return Path.home() / '.Mp4recovery'
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="MP4元数据复原工具")
+    parser.add_argument('--coordinator', metavar='DIR',
+                        help="协调者模式：扫描DIR并把任务分发给工作者")
+    parser.add_argument('--worker', metavar='URL',
+                        help="工作者模式：从URL处的协调者领取任务")
+    parser.add_argument('--serve', action='store_true',
+                        help="常驻服务模式：通过JSON接口接收其他进程提交的修复任务")
+    parser.add_argument('--socket', metavar='PATH',
+                        help="服务模式下改为监听Unix套接字PATH")
+    parser.add_argument('--host', help="监听地址（协调者默认0.0.0.0，服务默认127.0.0.1）")
+    parser.add_argument('--port', type=int, default=8765, help="协调者/服务监听端口")
+    parser.add_argument('--lease-seconds', type=int, default=300, help="任务租约时长（秒）")
+    parser.add_argument('--engine', choices=('auto', 'ffmpeg', 'pyav', 'null'),
+                        help="本次运行使用的重封装后端（默认取配置remux_engine）")
+    return parser.parse_args()
+
+def init_headless(args):
+    """无界面模式的公共初始化，日志同时输出到控制台"""
+    app_dir = get_app_data_dir()
+    app_dir.mkdir(parents=True, exist_ok=True)
+    config_mgr = ConfigManager(app_dir)
+    log.setup_logger(app_dir, config_mgr)
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('[%(asctime)s] %(message)s'))
+    logger.addHandler(console)
+    ffmpeg_mgr = FFmpegManager(app_dir, config_mgr)
+    video_processor = VideoProcessor(ffmpeg_mgr, config_mgr, app_dir)
+    video_processor.engine_selector.override = args.engine
+    return video_processor
+
+def run_coordinator(args):
+    # 协调者/工作者/服务模块（http.server/urllib）只在对应模式下导入，不增加界面启动耗时
+    from core.distributed import Coordinator
+    video_processor = init_headless(args)
+    files = video_processor.scan_directory(
+        args.coordinator, video_processor.config_mgr.get('recursive', True))
+    coordinator = Coordinator(files, lease_seconds=args.lease_seconds)
+    coordinator.serve(args.host or '0.0.0.0', args.port)
+    try:
+        coordinator.wait()
+    finally:
+        coordinator.stop()
+    counts = coordinator.status()['counts']
+    logger.info(f"全部任务完成: 成功 {counts.get('done', 0)} 个，失败 {counts.get('failed', 0)} 个")
+
+def run_worker(args):
+    from core.distributed import DistributedWorker
+    video_processor = init_headless(args)
+    if not video_processor.ffmpeg_mgr.ensure_ffmpeg():
+        return
+    DistributedWorker(args.worker, video_processor).run()
+
+def run_service(args):
+    from core.repair_service import RepairService
+    video_processor = init_headless(args)
+    if not video_processor.ffmpeg_mgr.ensure_ffmpeg():
+        return
+    service = RepairService(video_processor, video_processor.config_mgr.get('service_queue_size', 10000))
+    service.serve(args.host or '127.0.0.1', args.port, args.socket)
+    signal.signal(signal.SIGTERM, lambda signum, frame: service.request_stop())
+    try:
+        service.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+
 def main():
+    args = parse_args()
+    if args.coordinator:
+        return run_coordinator(args)
+    if args.worker:
+        return run_worker(args)
+    if args.serve:
+        return run_service(args)
+
     app = QApplication(sys.argv)
-    
+
     # 确保应用数据目录存在
     app_dir = get_app_data_dir()
     app_dir.mkdir(parents=True, exist_ok=True)
-    
-    # 初始化日志
-    log_signal = log.setup_logger(app_dir)
-    
-    # 初始化各个管理器
-    ffmpeg_mgr = FFmpegManager(app_dir)
-    if not ffmpeg_mgr.ensure_ffmpeg():
-        return
-        
+
+    # 初始化配置和日志（日志的轮转等参数来自配置）
     config_mgr = ConfigManager(app_dir)
+    log_signal = log.setup_logger(app_dir, config_mgr)
+
+    # 初始化各个管理器（FFmpeg延迟到窗口显示后在后台解析）
+    ffmpeg_mgr = FFmpegManager(app_dir, config_mgr)
     video_processor = VideoProcessor(ffmpeg_mgr, config_mgr, app_dir)
-    
+    video_processor.engine_selector.override = args.engine
+
     # 创建主窗口
     window = MainWindow(config_mgr, video_processor)
     window.show()
-    
+
     # 连接日志信号
     log_signal.connect(window.on_progress_update)
-    
+
+    def on_first_window():
+        elapsed = (time.perf_counter() - _START_TIME) * 1000
+        logger.info(f"启动耗时（至首个窗口）: {elapsed:.0f} ms")
+        init_worker.start()
+
+    def on_ffmpeg_ready(ok):
+        if not ok:
+            QMessageBox.critical(window, "错误", "未找到可用的FFmpeg，无法处理视频")
+
+    init_worker = FFmpegInitWorker(ffmpeg_mgr)
+    init_worker.ready.connect(on_ffmpeg_ready)
+    # 事件循环开始后（首个窗口已显示）再报告耗时并启动后台初始化
+    QTimer.singleShot(0, on_first_window)
+
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
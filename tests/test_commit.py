@@ -0,0 +1,73 @@
+"""提交单元的回滚，以及批量落盘失败时保留原文件"""
+from pathlib import Path
+from unittest import mock
+import errno
+import shutil
+import tempfile
+import unittest
+
+from core import commit
+from core.commit import CommitBatcher, CommitUnit
+
+class CommitTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.tmp = self.dir / 'tmp'
+        self.tmp.mkdir()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _unit(self, name):
+        """修复后另存为name_meta.mp4并删除原视频，与VideoProcessor的提交步骤相同"""
+        original = self.dir / f'{name}.mp4'
+        original.write_bytes(b'original')
+        output = self.tmp / f'{name}_meta.mp4'
+        output.write_bytes(b'repaired')
+        unit = CommitUnit(self.tmp)
+        unit.move(output, self.dir / output.name)
+        unit.stage_delete(original)
+        return unit, original, output
+
+    def test_rollback_restores_original_and_output(self):
+        unit, original, output = self._unit('a')
+        self.assertFalse(original.exists())
+        unit.rollback()
+        self.assertEqual(original.read_bytes(), b'original')
+        self.assertEqual(output.read_bytes(), b'repaired')
+        self.assertFalse((self.dir / 'a_meta.mp4').exists())
+        self.assertEqual(sorted(p.name for p in self.tmp.iterdir()), ['a_meta.mp4'])
+
+    def test_flush_deletes_originals_after_sync(self):
+        batcher = CommitBatcher(batch_size=16)
+        unit, original, _ = self._unit('a')
+        batcher.add(unit)
+        batcher.flush()
+        self.assertFalse(original.exists())
+        self.assertEqual((self.dir / 'a_meta.mp4').read_bytes(), b'repaired')
+        self.assertEqual(list(self.tmp.iterdir()), [])
+
+    def test_failed_fsync_keeps_original(self):
+        batcher = CommitBatcher(batch_size=16)
+        bad, bad_original, _ = self._unit('a')
+        good, good_original, _ = self._unit('b')
+        batcher.add(bad)
+        batcher.add(good)
+
+        real_fsync = commit.fsync_file
+        def fsync_file(path):
+            if Path(path).name == 'a_meta.mp4':
+                raise OSError(errno.EIO, 'Input/output error')
+            real_fsync(path)
+
+        with mock.patch('core.commit.fsync_file', fsync_file), self.assertLogs('mp4recovery', 'ERROR'):
+            batcher.flush()
+        # 未能落盘的单元回滚，原视频放回原位
+        self.assertEqual(bad_original.read_bytes(), b'original')
+        self.assertFalse((self.dir / 'a_meta.mp4').exists())
+        # 同一批次中已落盘的单元照常删除原视频
+        self.assertFalse(good_original.exists())
+        self.assertEqual((self.dir / 'b_meta.mp4').read_bytes(), b'repaired')
+
+if __name__ == '__main__':
+    unittest.main()
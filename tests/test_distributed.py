@@ -0,0 +1,138 @@
+"""协调者/工作者在本机（127.0.0.1）上的端到端测试：租约发放、过期回收后重新发放、结果汇总"""
+from pathlib import Path
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from core.distributed import Coordinator, DistributedWorker, coordinator_status
+from core.http_api import post_json
+from core.job_queue import JobTable
+
+class _Result:
+    def __init__(self, path, success=True):
+        self.path = str(path)
+        self.success = success
+
+    def to_dict(self):
+        return {'path': self.path, 'success': self.success, 'message': '成功处理' if self.success else '处理失败'}
+
+class _Processor:
+    """只记录调用的处理器（VideoProcessor依赖PyQt5和ffmpeg，这里只测试分发流程）"""
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.videos = []
+        self.series = []
+        self._lock = threading.Lock()
+
+    def process_video(self, path, tmp_dir=None):
+        time.sleep(self.delay)
+        with self._lock:
+            self.videos.append(str(path))
+        return _Result(path)
+
+    def process_series(self, segments, tmp_dir=None):
+        time.sleep(self.delay)
+        with self._lock:
+            self.series.append([str(s) for s in segments])
+        return _Result(segments[0])
+
+    def flush_commits(self):
+        pass
+
+class DistributedTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.servers = []
+
+    def tearDown(self):
+        for coordinator in self.servers:
+            coordinator.stop()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _files(self, names):
+        paths = []
+        for name in names:
+            path = self.dir / name
+            path.write_bytes(b'')
+            paths.append(path)
+        return paths
+
+    def _serve(self, files, lease_seconds=30):
+        coordinator = Coordinator(files, lease_seconds=lease_seconds)
+        self.servers.append(coordinator)
+        return coordinator, coordinator.serve('127.0.0.1', 0).address
+
+    def _run_workers(self, url, processors):
+        workers = [DistributedWorker(url, p, worker_id=f'w{i}', poll_interval=0.05)
+                   for i, p in enumerate(processors)]
+        threads = [threading.Thread(target=w.run, daemon=True) for w in workers]
+        for t in threads:
+            t.start()
+        return workers, threads
+
+    def _join(self, coordinator, threads, timeout=20):
+        deadline = time.monotonic() + timeout
+        while not coordinator.is_done() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        for t in threads:
+            t.join(max(0.1, deadline - time.monotonic()))
+        self.assertTrue(coordinator.is_done(), '任务未在限定时间内完成')
+
+    def test_workers_share_jobs_and_results_are_collected(self):
+        files = self._files([f'v{i}.mp4' for i in range(12)])
+        coordinator, url = self._serve(files)
+        processors = [_Processor(), _Processor()]
+        _, threads = self._run_workers(url, processors)
+        self._join(coordinator, threads)
+
+        processed = processors[0].videos + processors[1].videos
+        self.assertEqual(sorted(processed), sorted(str(f) for f in files))  # 每个任务只处理一次
+        self.assertTrue(processors[0].videos and processors[1].videos)      # 两个工作者都领到了任务
+        status = coordinator_status(url)
+        self.assertEqual(status['counts'], {'done': 12})
+        self.assertEqual(sorted(r['path'] for r in status['results']), sorted(str(f) for f in files))
+        self.assertEqual({r['worker'] for r in status['results']}, {'w0', 'w1'})
+
+    def test_expired_lease_is_reassigned(self):
+        files = self._files(['a.mp4', 'b.mp4'])
+        coordinator, url = self._serve(files, lease_seconds=0.3)
+        # 模拟崩溃的工作者：领取任务后不续约也不回报
+        _, reply = post_json(f'{url}/lease', {'worker': 'crashed'})
+        stale = reply['job']
+        self.assertEqual(stale['path'], str(files[0]))
+        time.sleep(0.5)
+
+        processors = [_Processor(), _Processor()]
+        _, threads = self._run_workers(url, processors)
+        self._join(coordinator, threads)
+
+        self.assertIn(str(files[0]), processors[0].videos + processors[1].videos)
+        job = coordinator.jobs[stale['id']]
+        self.assertEqual(job['attempts'], 2)
+        self.assertNotEqual(job['result']['worker'], 'crashed')
+        # 租约已转给其他工作者后，崩溃工作者迟到的结果被拒绝
+        status, reply = post_json(f'{url}/report', {'id': stale['id'], 'lease': stale['lease'],
+                                                    'result': {'success': False}})
+        self.assertEqual(status, 409)
+        self.assertEqual(coordinator_status(url)['counts'], {'done': 2})
+
+    def test_segment_series_is_one_job(self):
+        files = self._files(['rec_001.mp4', 'rec_002.mp4', 'rec_003.mp4', 'other.mp4'])
+        table = JobTable.from_paths(files)
+        table.sort()
+        table.group_series(re.compile(r'^(.+)_(\d{3})\.mp4$'))
+        coordinator, url = self._serve(table)
+        processors = [_Processor(), _Processor()]
+        _, threads = self._run_workers(url, processors)
+        self._join(coordinator, threads)
+
+        self.assertEqual(len(coordinator.jobs), 2)
+        series = processors[0].series + processors[1].series
+        self.assertEqual(series, [[str(f) for f in files[:3]]])
+        self.assertEqual(processors[0].videos + processors[1].videos, [str(files[3])])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""修复服务的工作线程：单个任务的意外错误记为失败，不影响后续任务"""
+from pathlib import Path
+import shutil
+import tempfile
+import time
+import unittest
+
+from core.http_api import post_json
+from core.job_control import JobControl
+from core.repair_service import RepairService
+
+class _Config:
+    def __init__(self, **values):
+        self.values = values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+class _Result:
+    def __init__(self, path):
+        self.path = str(path)
+        self.success = True
+        self.elapsed = 0.01
+        self.metrics = {}
+
+    def __bool__(self):
+        return self.success
+
+    def to_dict(self):
+        return {'path': self.path, 'success': True, 'message': '成功处理'}
+
+class _Processor:
+    """目录不存在时像VideoProcessor获取临时目录那样抛出异常"""
+    def __init__(self):
+        self.config_mgr = _Config(max_workers=1)
+        self.control = JobControl()
+        self.tmp_manager = None
+
+    def process_video(self, path, tmp_dir=None):
+        if not Path(path).parent.is_dir():
+            raise FileNotFoundError(f"目录不存在: {Path(path).parent}")
+        return _Result(path)
+
+    def flush_commits(self):
+        pass
+
+class RepairServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.service = RepairService(_Processor())
+
+    def tearDown(self):
+        self.service.stop()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _wait(self, ids, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(self.service.status(i)['state'] not in ('queued', 'running') for i in ids):
+                return
+            time.sleep(0.02)
+        self.fail('任务未在限定时间内完成')
+
+    def test_unexpected_error_fails_job_and_keeps_worker(self):
+        good = self.dir / 'a.mp4'
+        good.write_bytes(b'')
+        self.service.start_workers()
+        ids, _ = self.service.submit([str(self.dir / 'missing' / 'a.mp4'), str(good)])
+        self._wait(ids)
+
+        bad_job, good_job = (self.service.status(i) for i in ids)
+        self.assertEqual(bad_job['state'], 'failed')
+        self.assertIn('目录不存在', bad_job['result']['message'])
+        self.assertEqual(good_job['state'], 'done')
+        self.assertTrue(all(t.is_alive() for t in self.service._threads))
+
+    def test_submit_rejects_missing_files(self):
+        address = self.service.serve('127.0.0.1', 0)
+        status, reply = post_json(f'{address}/submit', {'files': [str(self.dir / 'missing.mp4')]})
+        self.assertEqual(status, 400)
+        self.assertEqual(reply['files'], [str(self.dir / 'missing.mp4')])
+        self.assertEqual(self.service.status()['counts'], {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,8 @@ from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout,
                             QWidget)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont, QIcon
-from pathlib import Path
 from core.tmp_dir_manager import TmpDirManager
+from core.job_queue import JobTable
 
 class FileItemWidget(QWidget):
     def __init__(self, filename, parent=None):
@@ -203,9 +203,9 @@ class ConfirmDialog(QDialog):
         list_file = self.parent().video_processor.user_dir/'preprocesslist.txt'
         if list_file.exists():
             with open(list_file, encoding='utf-8') as f:
-                files = [Path(line.strip()) for line in f]
+                files = JobTable.from_lines(f)
             if files:
-                orig_dirs = set(f.parent for f in files)
+                orig_dirs = files.dir_paths()
                 try:
                     tmp_dir_map = self.tmp_manager.create_tmp_dirs(orig_dirs)
                 except Exception as e:
@@ -214,6 +214,8 @@ class ConfirmDialog(QDialog):
                     return
                     
                 self.parent().video_processor.dir_tmp_map = tmp_dir_map
+                # 处理过程中追加的目录按需创建临时目录
+                self.parent().video_processor.tmp_manager = self.tmp_manager
                 
                 # 统计变量
                 self._stat_total = len(files)
@@ -230,12 +232,10 @@ class ConfirmDialog(QDialog):
                             for line in msg.splitlines():
                                 if '跳过' in line and '.mp4' in line:
                                     self._stat_skipped_files.append(line.split(':')[-1].strip())
-                        elif '成功处理' in msg:
-                            self._stat_success += 1
                         elif '处理失败' in msg:
+                            # 成功/失败数在结束时按任务表统计，这里只收集失败的文件名
                             for line in msg.splitlines():
                                 if '处理失败' in line and '.mp4' in line:
-                                    self._stat_failed += 1
                                     self._stat_failed_files.append(line.split(':')[-1].strip())
                 
                 # 设置处理标志
@@ -243,16 +243,26 @@ class ConfirmDialog(QDialog):
                 self.parent().video_processor.progress_updated.connect(on_progress)
                 worker = self.parent().video_processor.process_files(files)
                 self.ok_btn.setEnabled(False)
+                if hasattr(self.parent(), 'on_batch_started'):
+                    self.parent().on_batch_started(worker)
                 
                 def on_finish():
                     self.is_processing = False
                     self.ok_btn.setEnabled(True)
                     self.tmp_manager.cleanup_tmp_dirs()
+                    self.parent().video_processor.tmp_manager = None
+                    # 包含处理过程中追加的视频；按任务表统计，拼接的分段系列按段数计
+                    self._stat_total = worker.queue.total
+                    self._stat_success = worker.queue.table.count(JobTable.DONE)
+                    self._stat_failed = worker.queue.table.count(JobTable.FAILED)
+                    if hasattr(self.parent(), 'on_batch_finished'):
+                        self.parent().on_batch_finished(worker)
                     
                     # 输出统计
                     stat_msg = f"<span style='color:orange;'><b>总计: {self._stat_total} 个视频<br>成功: {self._stat_success} 个<br>失败: {self._stat_failed} 个" \
                         + (f"<br>失败的视频为：{'；'.join(self._stat_failed_files)}" if self._stat_failed_files else "") \
                         + (f"<br>跳过的视频为：{'；'.join(self._stat_skipped_files)}" if self._stat_skipped_files else "") \
+                        + (f"<br>已取消，未处理: {len(worker.remaining)} 个（保留在待处理列表中）" if worker.remaining else "") \
                         + "</b></span>"
                     if hasattr(self.parent(), 'log_text'):
                         self.parent().log_text.append(stat_msg)
@@ -5,6 +5,7 @@ from PyQt5.QtCore import Qt, QThread
 from pathlib import Path
 import logging
 from .confirm_dialog import ConfirmDialog
+from core.job_queue import RootQueue
 
 logger = logging.getLogger('mp4recovery')
 
@@ -13,6 +14,8 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.config_mgr = config_mgr
         self.video_processor = video_processor
+        self.root_queue = RootQueue(config_mgr)  # 持久化的根目录队列
+        self.batch_worker = None  # 正在运行的批处理
         self.setup_ui()
         self.load_config()
         self.center_window()
@@ -41,8 +44,13 @@ class MainWindow(QMainWindow):
         self.path_label.setMinimumWidth(300)
         self.path_label.setToolTip(self.config_mgr.get('last_directory', '未选择目录'))
         self.select_btn = QPushButton("选择目录")
+        self.queue_btn = QPushButton("加入队列")
+        self.queue_btn.setToolTip("把当前目录加入待处理队列，处理中也可以追加")
+        self.queue_label = QLabel()
         dir_layout.addWidget(self.path_label)
         dir_layout.addWidget(self.select_btn)
+        dir_layout.addWidget(self.queue_btn)
+        dir_layout.addWidget(self.queue_label)
         
         # 后缀设置部分
         suffix_layout = QHBoxLayout()
@@ -94,15 +102,29 @@ class MainWindow(QMainWindow):
         self.process_btn = QPushButton("开始处理")
         self.process_btn.setEnabled(False)
         
+        # 暂停/停止按钮，仅在处理中可用
+        control_layout = QHBoxLayout()
+        self.pause_btn = QPushButton("暂停")
+        self.stop_btn = QPushButton("停止")
+        self.pause_btn.setEnabled(False)
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.setToolTip("结束正在处理的视频，未处理的视频保留在待处理列表中")
+        control_layout.addWidget(self.process_btn, 1)
+        control_layout.addWidget(self.pause_btn)
+        control_layout.addWidget(self.stop_btn)
+        
         # 布局添加
         layout.addLayout(top_layout)
         layout.addLayout(sync_layout)
         layout.addWidget(self.log_text)
-        layout.addWidget(self.process_btn)
+        layout.addLayout(control_layout)
         
         # 信号连接
         self.select_btn.clicked.connect(self.select_directory)
+        self.queue_btn.clicked.connect(self.enqueue_directory)
         self.process_btn.clicked.connect(self.start_process)
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.stop_btn.clicked.connect(self.stop_process)
         self.recursive_cb.stateChanged.connect(self.on_recursive_changed)
         self.suffix_edit.editingFinished.connect(self.on_suffix_changed)
         self.regex_edit.editingFinished.connect(self.on_regex_changed)
@@ -162,6 +184,7 @@ class MainWindow(QMainWindow):
         if last_dir:
             self.path_label.setText(last_dir)
             self.process_btn.setEnabled(True)
+        self.update_queue_label()
             
         # 加载后缀设置
         suffix = self.config_mgr.get('output_suffix')
@@ -231,19 +254,47 @@ class MainWindow(QMainWindow):
         self.suffix_edit.setText(default_suffix)
         self.on_suffix_changed()
 
+    def update_queue_label(self):
+        """显示队列中的根目录"""
+        roots = self.root_queue.roots
+        self.queue_label.setText(f"队列: {len(roots)} 个目录" if roots else "")
+        self.queue_label.setToolTip("\n".join(roots))
+
+    def enqueue_directory(self):
+        """把当前目录加入根目录队列；正在处理时直接追加到运行中的批次"""
+        path = self.path_label.text()
+        if not path or not Path(path).is_dir():
+            return
+        if not self.root_queue.add(path):
+            logger.info(f"目录已在队列中（或被队列中的目录包含）: {path}")
+        self.update_queue_label()
+        if self.batch_worker is not None:
+            self.append_to_running(path)
+
+    def append_to_running(self, path):
+        """在后台扫描目录并追加到正在运行的批次（界面不等待扫描），已在队列中的视频不会重复加入"""
+        if self.batch_worker.add_directory(path, self.recursive_cb.isChecked()):
+            logger.info(f"正在扫描并追加到运行中的批次: {path}")
+        else:
+            logger.info(f"当前批次即将结束，目录已保留在队列中，下次处理: {path}")
+
     def start_process(self):
         """开始处理"""
         path = self.path_label.text()
         if not path:
             return
         
-        # 1. 先清理旧的临时目录和映射，防止多次处理时残留
-        #self.parent().video_processor.created_tmp_dirs.clear()
-        #self.parent().video_processor.dir_tmp_map.clear()
+        # 正在处理时不再新开批次，而是追加到运行中的批次
+        if self.batch_worker is not None:
+            self.append_to_running(path)
+            return
         
-        # 扫描文件
-        files = self.video_processor.scan_directory(
-            path,
+        # 扫描队列中的所有根目录和当前目录（重叠的根目录只扫描一次）
+        roots = self.root_queue.roots
+        if path not in roots:
+            roots.append(path)
+        files = self.video_processor.scan_roots(
+            roots,
             self.recursive_cb.isChecked()
         )
         
@@ -254,15 +305,41 @@ class MainWindow(QMainWindow):
         # 显示确认对话框
         dlg = ConfirmDialog(self)
         dlg.exec_()
-        # if dlg.exec_():
-        #     # 异步处理文件
-        #     #worker = self.video_processor.process_files(files)
-        #     # 禁用开始按钮，直到处理完成
-        #     self.process_btn.setEnabled(False)
-        #     worker.finished.connect(lambda: self.process_btn.setEnabled(True))
-        
-        # 4. 处理完成后清理临时目录
-        #self.parent().video_processor.cleanup_tmp_dirs()
+
+    def on_batch_started(self, worker):
+        """批处理开始，启用暂停/停止按钮"""
+        self.batch_worker = worker
+        self.pause_btn.setText("暂停")
+        self.pause_btn.setEnabled(True)
+        self.stop_btn.setEnabled(True)
+
+    def on_batch_finished(self, worker):
+        """批处理结束，禁用暂停/停止按钮；未取消时清空已处理完的根目录队列"""
+        self.batch_worker = None
+        if not worker.remaining:
+            self.root_queue.clear()
+            self.update_queue_label()
+        self.pause_btn.setText("暂停")
+        self.pause_btn.setEnabled(False)
+        self.stop_btn.setEnabled(False)
+
+    def toggle_pause(self):
+        """暂停/继续当前批处理（会挂起正在运行的ffmpeg）"""
+        control = self.video_processor.control
+        if control.is_paused():
+            control.resume()
+            self.pause_btn.setText("暂停")
+        else:
+            control.pause()
+            self.pause_btn.setText("继续")
+
+    def stop_process(self):
+        """停止当前批处理"""
+        reply = QMessageBox.question(self, "确认", "确定停止处理吗？正在处理的视频会被中止，原视频保留。")
+        if reply == QMessageBox.Yes:
+            self.video_processor.control.cancel()
+            self.pause_btn.setEnabled(False)
+            self.stop_btn.setEnabled(False)
 
     def clear_log(self):
         """清空日志输出"""